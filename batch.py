@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import concurrent.futures
+import csv
+import fnmatch
+import glob
+import importlib
+import os
+
+from track_loader import Track_Loader
+
+from engine import (
+    DEFAULT_SPEED,
+    REWARD_MODULE,
+    TRACK,
+    Simulation,
+    load_reward_module,
+)
+from headless import LAPS, MAX_STEPS, run_headless
+from recorder import TraceRecorder
+from reward_cache import CACHE_SIZE, get_reward_cache
+from track_cache import get_route_names
+
+# Constants
+TITLE = "DeepRacer Batch Runner"
+FUNCTIONS_DIR = "./functions/"
+COLUMNS = ["track", "reward_module", "lap_time", "completion", "offtrack", "crashed", "mean_reward", "steps", "steps_per_sec", "cache_hit_rate", "error"]
+
+# Tracks loaded by this worker process
+g_tracks = {}
+
+def parse_args():
+    params = argparse.ArgumentParser(description=TITLE)
+    params.add_argument("-t", "--tracks", nargs="+", default=[TRACK], help="track names or globs, e.g. '2022_*'")
+    params.add_argument("-r", "--reward-modules", nargs="+", default=[REWARD_MODULE], help="reward module names or globs, e.g. '*'")
+    params.add_argument("-s", "--speed", type=float, default=DEFAULT_SPEED, help="speed")
+    params.add_argument("-l", "--laps", type=int, default=LAPS, help="laps to drive")
+    params.add_argument("--max-steps", type=int, default=MAX_STEPS, help="max steps before giving up")
+    params.add_argument("--workers", type=int, default=None, help="processes count")
+    params.add_argument("-o", "--output", default=None, help="csv file to write the summary to")
+    params.add_argument("--reward-cache", default=False, action="store_true", help="memoize rewards of the modules declaring REWARD_CACHE_KEYS")
+    params.add_argument("--reward-cache-size", type=int, default=CACHE_SIZE, help="rewards kept in each cache")
+    params.add_argument("--reward-cache-persist", default=False, action="store_true", help="keep the caches between runs, per module and track")
+    params.add_argument("--record", default=None, help="directory to record every run to, one trace per track and module")
+    return params.parse_args()
+
+def get_reward_module_names():
+    '''Get the names of every reward module'''
+    names = [os.path.basename(path)[:-3] for path in glob.glob(FUNCTIONS_DIR + "*.py")]
+    return sorted(name for name in names if not name.startswith("_"))
+
+def match_names(patterns, names):
+    '''Get the names matching any of the patterns, in order and without duplicates'''
+    matches = []
+    for pattern in patterns:
+        found = fnmatch.filter(names, pattern)
+        if len(found) == 0:
+            raise ValueError("Nothing matches {}".format(pattern))
+        matches += [name for name in found if name not in matches]
+    return matches
+
+def get_track(name):
+    '''Get a track, loaded once per worker process'''
+    if name not in g_tracks:
+        g_tracks[name] = Track_Loader(name)
+    return g_tracks[name]
+
+def evaluate(track_name, module_name, speed, laps, max_steps, record_dir=None, cache_size=None, cache_persist=False):
+    '''Drive one track with one reward module and get its summary row'''
+    row = {"track": track_name, "reward_module": module_name}
+
+    try:
+        # Reward modules keep state in globals, e.g. the waypoints of the last track
+        reward_module = importlib.reload(load_reward_module(module_name))
+
+        recorder = None
+        if record_dir:
+            recorder = TraceRecorder(os.path.join(record_dir, track_name + "-" + module_name), track_name, module_name, 0)
+
+        reward_cache = None
+        if cache_size:
+            reward_cache = get_reward_cache(reward_module, track_name, cache_size, cache_persist)
+
+        sim = Simulation(get_track(track_name), reward_module, speed, reward_cache=reward_cache)
+        try:
+            summary = run_headless(sim, laps, max_steps, recorder)
+        finally:
+            sim.close()
+            if recorder is not None:
+                recorder.close()
+
+        if reward_cache is not None:
+            reward_cache.save()
+            row["cache_hit_rate"] = reward_cache.get_stats()["hit_rate"]
+    except Exception as ex:
+        row["error"] = repr(ex)
+        return row
+
+    lap_times = summary["lap_times"]
+    reward_steps = summary["steps"] - summary["offtrack_count"]
+
+    row["lap_time"] = sum(lap_times) / len(lap_times) if len(lap_times) > 0 else None
+    if len(lap_times) >= laps:
+        row["completion"] = 100.0
+    else:
+        row["completion"] = (len(lap_times) + summary["progress"] / 100) / laps * 100
+    row["offtrack"] = summary["offtrack_count"]
+    row["crashed"] = summary["crashed_count"]
+    row["mean_reward"] = summary["total_reward"] / reward_steps if reward_steps > 0 else None
+    row["steps"] = summary["steps"]
+    row["steps_per_sec"] = summary["steps_per_sec"]
+
+    return row
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.3f}".format(value)
+    return str(value)
+
+def print_table(rows):
+    '''Print the summary rows as a table'''
+    table = [COLUMNS] + [[format_value(row.get(column)) for column in COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(COLUMNS))]
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+
+def write_csv(path, rows):
+    '''Write the summary rows to a csv file'''
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({column: row.get(column) for column in COLUMNS})
+
+def run():
+    '''Evaluate every track with every reward module on a process pool'''
+    args = parse_args()
+
+    tracks = match_names(args.tracks, get_route_names())
+    modules = match_names(args.reward_modules, get_reward_module_names())
+
+    print("running", len(tracks), "tracks x", len(modules), "reward modules")
+
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        tasks = [
+            executor.submit(evaluate, track_name, module_name, args.speed, args.laps, args.max_steps, args.record,
+                            args.reward_cache_size if args.reward_cache else None, args.reward_cache_persist)
+            for track_name in tracks
+            for module_name in modules
+        ]
+        for task in concurrent.futures.as_completed(tasks):
+            row = task.result()
+            rows.append(row)
+            print("done", row["track"], row["reward_module"])
+
+    rows.sort(key=lambda row: (row["track"], row["reward_module"]))
+
+    print_table(rows)
+
+    if args.output:
+        write_csv(args.output, rows)
+        print("written", args.output)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import fnmatch
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from track_loader import Track_Loader
+
+from batch import get_reward_module_names
+from collision import find_collisions, get_hits
+from engine import (
+    SPEEDS,
+    STEERING_ANGLE,
+    Simulation,
+    init_bots,
+    load_reward_module,
+)
+from geometry import get_distance_list
+from reward_pool import calculate_reward
+from track_query import TrackProjection, TrackQuery
+from track_raster import TrackRaster
+from vector_env import VectorEnv
+
+# Constants
+TITLE = "DeepRacer Simulator Benchmark"
+BENCH_ROUTES = [
+    "reinvent_base",  # 71 waypoints
+    "jyllandsringen_pro_cw",  # 210 waypoints
+    "New_York_Eval_Track",  # 427 waypoints
+]
+BENCH_MODULE = "TwoDigitsOptimised"  # drives the car for the recorded states
+BENCH_STATES = 100  # steps driven to get realistic car states
+BENCH_CALLS = 200  # timed calls per benchmark
+BENCH_MEMORY_CALLS = 10  # calls traced for the peak memory
+BENCH_BOTS = 6
+BENCH_FLEET = 200  # bots of the large fleet benchmark
+BENCH_ENV_MODULE = "example1"  # cheap, so the vector env itself is timed
+THRESHOLD = 0.2  # slower than the baseline by this much is a regression
+STARTUP_RUNS = 10
+STARTUP_MODULE = "example1"  # a module without heavy imports of its own
+STARTUP_TARGET = 0.25  # seconds from a fresh interpreter to the first headless step
+
+def parse_args():
+    params = argparse.ArgumentParser(description=TITLE)
+    params.add_argument("-t", "--tracks", nargs="+", default=BENCH_ROUTES, help="track names")
+    params.add_argument("-k", "--filter", default="*", help="only benchmarks matching this glob, e.g. 'calculate_reward.*'")
+    params.add_argument("-n", "--calls", type=int, default=BENCH_CALLS, help="timed calls per benchmark")
+    params.add_argument("-o", "--output", default=None, help="json file to save the results to, as a baseline")
+    params.add_argument("-b", "--baseline", default=None, help="json file of a previous run to compare with")
+    params.add_argument("--threshold", type=float, default=THRESHOLD, help="slowdown flagged as regression, 0.2 is 20%%")
+    params.add_argument("--startup-target", type=float, default=STARTUP_TARGET, help="seconds the headless startup must stay under")
+    return params.parse_args()
+
+def measure(func, calls):
+    '''Time func one call at a time, and trace the peak memory of a few more calls'''
+    func(0)  # warm up caches and imports
+
+    latencies = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        func(i)
+        latencies[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    for i in range(min(calls, BENCH_MEMORY_CALLS)):
+        func(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        "calls": calls,
+        "mean_us": float(latencies.mean() * 1e6),
+        "p50_us": float(p50),
+        "p90_us": float(p90),
+        "p99_us": float(p99),
+        "per_sec": float(calls / latencies.sum()),
+        "peak_kb": peak / 1024,
+    }
+
+def measure_startup(runs):
+    '''Time starting headless.py in a fresh interpreter, up to where it would drive'''
+    command = [sys.executable, "headless.py", "-r", STARTUP_MODULE, "--max-steps", "0"]
+
+    latencies = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        latencies[i] = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        "calls": runs,
+        "mean_us": float(latencies.mean() * 1e6),
+        "p50_us": float(p50),
+        "p90_us": float(p90),
+        "p99_us": float(p99),
+        "per_sec": float(runs / latencies.sum()),
+        "peak_kb": 0.0,  # in another process
+    }
+
+def record_states(track):
+    '''Drive the car among bots for a while and keep the params of every step'''
+    sim = Simulation(track, load_reward_module(BENCH_MODULE), bots_count=BENCH_BOTS, bots_speed=1)
+    states = []
+    for _ in range(BENCH_STATES):
+        result = sim.step()
+        if result.offtrack:
+            sim.reset_car(result.closest_idx)
+        states.append(result)
+    sim.close()
+    return states
+
+def get_benchmarks(track, states):
+    '''Get the benchmarks of a track, by name'''
+    benchmarks = {}
+
+    waypoints = track.get_center_waypoints()
+    sim = Simulation(track, load_reward_module(BENCH_MODULE), bots_count=BENCH_BOTS, bots_speed=1)
+
+    def state(i):
+        return states[i % len(states)]
+
+    def bench_distance_list(i):
+        get_distance_list((state(i).params["x"], state(i).params["y"]), waypoints)
+    benchmarks["get_distance_list"] = bench_distance_list
+
+    query = TrackQuery(waypoints)
+    benchmarks["track_query.global"] = lambda i: query.closest((state(i).params["x"], state(i).params["y"]))
+    benchmarks["track_query.window"] = lambda i: query.closest((state(i).params["x"], state(i).params["y"]), state(i - 1).closest_idx)
+
+    projection = TrackProjection(track.get_geometry())
+    benchmarks["track_projection.window"] = lambda i: projection.project_one(
+        (state(i).params["x"], state(i).params["y"]), state(i - 1).params["closest_waypoints"][0])
+
+    raster = TrackRaster(track.route)
+    benchmarks["track_raster.query"] = lambda i: raster.query((state(i).params["x"], state(i).params["y"]))
+
+    fleet_pos = np.array([(states[i % len(states)].params["x"], states[i % len(states)].params["y"]) for i in range(BENCH_FLEET)])
+    benchmarks["track_raster.query.{}".format(BENCH_FLEET)] = lambda i: raster.query(fleet_pos)
+
+    benchmarks["find_destination"] = lambda i: sim.raycaster.find_destination(
+        (state(i).params["x"], state(i).params["y"]), state(i).params["heading"], state(i).closest_idx, sim.track_width)
+
+    for name in get_reward_module_names():
+        # Fresh module state for every track
+        reward_module = importlib.reload(load_reward_module(name))
+
+        def bench_reward(i, reward_module=reward_module):
+            speed = SPEEDS[i % len(SPEEDS)]
+            steering_angle = STEERING_ANGLE[i % len(STEERING_ANGLE)]
+            calculate_reward(reward_module, state(i).params, speed, steering_angle)
+        benchmarks["calculate_reward." + name] = bench_reward
+
+    bots = init_bots(track, BENCH_BOTS, 1)
+    benchmarks["bot_update"] = lambda i: bots.move()
+
+    fleet = init_bots(track, BENCH_FLEET, 1)
+    benchmarks["bot_update.{}".format(BENCH_FLEET)] = lambda i: fleet.move()
+
+    benchmarks["collision.hits"] = lambda i: get_hits(
+        (state(i).params["x"], state(i).params["y"]), state(i).params["heading"], bots.pos, bots.heading)
+    benchmarks["collision.pairs.{}".format(BENCH_FLEET)] = lambda i: find_collisions(fleet.pos, fleet.heading)
+
+    env = VectorEnv(track, load_reward_module(BENCH_ENV_MODULE), BENCH_FLEET)
+    env_actions = np.column_stack([np.zeros(BENCH_FLEET), np.full(BENCH_FLEET, SPEEDS[0])])
+
+    def bench_env_step(i):
+        env.step(env_actions)
+        if env.done.any():
+            env.reset(env.done, i)
+    benchmarks["vector_env.step.{}".format(BENCH_FLEET)] = bench_env_step
+
+    def bench_step(i):
+        result = sim.step()
+        if result.offtrack:
+            sim.reset_car(result.closest_idx)
+    benchmarks["headless_step"] = bench_step
+
+    return benchmarks, sim
+
+def compare(results, baseline, threshold):
+    '''Get the benchmarks with a median slower than the baseline by more than threshold'''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = result["p50_us"] / previous["p50_us"] if previous["p50_us"] > 0 else 1
+        if ratio > 1 + threshold:
+            regressions.append((name, previous["p50_us"], result["p50_us"], ratio))
+    return regressions
+
+def run():
+    '''Run every benchmark on every track'''
+    args = parse_args()
+
+    results = {}
+    failed = False
+
+    if fnmatch.fnmatch("startup.headless", args.filter):
+        result = measure_startup(STARTUP_RUNS)
+        results["startup/headless"] = result
+        print("startup")
+        print("  {:<36} p50 {:>10.1f}us  p90 {:>10.1f}us  p99 {:>10.1f}us  target {:.0f}us".format(
+            "headless", result["p50_us"], result["p90_us"], result["p99_us"], args.startup_target * 1e6))
+        if result["p50_us"] > args.startup_target * 1e6:
+            print("STARTUP headless p50 {:.3f}s over the {:.3f}s target".format(result["p50_us"] / 1e6, args.startup_target))
+            failed = True
+
+    for track_name in args.tracks:
+        track = Track_Loader(track_name)
+        states = record_states(track)
+        benchmarks, sim = get_benchmarks(track, states)
+
+        print("track", track_name, len(track.get_center_waypoints()))
+        for name, func in benchmarks.items():
+            if not fnmatch.fnmatch(name, args.filter):
+                continue
+            try:
+                result = measure(func, args.calls)
+            except Exception as ex:
+                print("  {:<36} failed {!r}".format(name, ex))
+                continue
+            results[track_name + "/" + name] = result
+            print("  {:<36} p50 {:>10.1f}us  p90 {:>10.1f}us  p99 {:>10.1f}us  {:>10.0f}/sec  {:>8.1f}kb".format(
+                name, result["p50_us"], result["p90_us"], result["p99_us"], result["per_sec"], result["peak_kb"]))
+        sim.close()
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("saved", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        for name, previous, current, ratio in regressions:
+            print("REGRESSION {} p50 {:.1f}us -> {:.1f}us ({:.0%} slower)".format(name, previous, current, ratio - 1))
+        if len(regressions) > 0:
+            failed = True
+        else:
+            print("no regressions against", args.baseline)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run()
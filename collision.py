@@ -0,0 +1,103 @@
+import numpy as np
+
+# Constants
+CAR_LENGTH = 0.8  # meters, as big as the car sprites are drawn
+CAR_WIDTH = 0.4
+
+def get_radius(length=CAR_LENGTH, width=CAR_WIDTH):
+    '''Get the radius of the circle around a car'''
+    return np.hypot(length, width) / 2
+
+def obb_overlap(pos_a, heading_a, pos_b, heading_b, length=CAR_LENGTH, width=CAR_WIDTH):
+    '''Get whether each pair of cars, as oriented boxes, overlap, by the separating axis test'''
+    rad_a = np.radians(heading_a)
+    rad_b = np.radians(heading_b)
+    cos_a, sin_a = np.cos(rad_a), np.sin(rad_a)
+    cos_b, sin_b = np.cos(rad_b), np.sin(rad_b)
+
+    pos_a = np.asarray(pos_a, dtype=float)
+    pos_b = np.asarray(pos_b, dtype=float)
+    dx = pos_b[:, 0] - pos_a[:, 0]
+    dy = pos_b[:, 1] - pos_a[:, 1]
+
+    # both boxes have the same size, only the angle between them matters
+    cos_diff = np.abs(np.cos(rad_a - rad_b))
+    sin_diff = np.abs(np.sin(rad_a - rad_b))
+    half_length, half_width = length / 2, width / 2
+    along = half_length * cos_diff + half_width * sin_diff  # of one box on the forward axis of the other
+    across = half_length * sin_diff + half_width * cos_diff  # of one box on the left axis of the other
+
+    # overlapping unless one of the 4 axes separates them
+    return (
+        (np.abs(dx * cos_a + dy * sin_a) <= half_length + along) &
+        (np.abs(dy * cos_a - dx * sin_a) <= half_width + across) &
+        (np.abs(dx * cos_b + dy * sin_b) <= half_length + along) &
+        (np.abs(dy * cos_b - dx * sin_b) <= half_width + across))
+
+def get_hits(pos, heading, others_pos, others_heading, length=CAR_LENGTH, width=CAR_WIDTH):
+    '''Get which of the other cars the car overlaps'''
+    others_pos = np.asarray(others_pos, dtype=float).reshape(-1, 2)
+    hits = np.zeros(len(others_pos), dtype=bool)
+
+    near = np.hypot(others_pos[:, 0] - pos[0], others_pos[:, 1] - pos[1]) <= 2 * get_radius(length, width)
+    if near.any():
+        count = int(near.sum())
+        hits[near] = obb_overlap(
+            np.tile(np.asarray(pos, dtype=float)[:2], (count, 1)), np.full(count, heading),
+            others_pos[near], np.asarray(others_heading, dtype=float)[near],
+            length, width)
+    return hits
+
+def expand_ranges(starts, ends):
+    '''Get the owner and the index of every item of the ranges from starts up to ends'''
+    counts = np.maximum(ends - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), counts)
+    items = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, items
+
+def get_candidate_pairs(pos, radius):
+    '''Get the pairs of cars whose circles may overlap, from the cells of a uniform grid'''
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    count = len(pos)
+    if count < 2:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # cells as wide as a circle, so only the neighbour cells can overlap
+    cells = np.floor((pos - pos.min(axis=0)) / (2 * radius)).astype(np.int64)
+    rows = cells[:, 1].max() + 3
+    keys = (cells[:, 0] + 1) * rows + cells[:, 1] + 1
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pairs_i = []
+    pairs_j = []
+
+    # the same cell, then half of the neighbours so every pair is found once
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        neighbour_keys = sorted_keys + dx * rows + dy
+        ends = np.searchsorted(sorted_keys, neighbour_keys, side="right")
+        if dx == 0 and dy == 0:
+            starts = np.arange(1, count + 1)
+        else:
+            starts = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        owners, items = expand_ranges(starts, ends)
+        pairs_i.append(order[owners])
+        pairs_j.append(order[items])
+
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    near = np.hypot(pos[i, 0] - pos[j, 0], pos[i, 1] - pos[j, 1]) <= 2 * radius
+    return i[near], j[near]
+
+def find_collisions(pos, heading, length=CAR_LENGTH, width=CAR_WIDTH):
+    '''Get the pairs of overlapping cars, as two index arrays'''
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    heading = np.asarray(heading, dtype=float)
+
+    i, j = get_candidate_pairs(pos, get_radius(length, width))
+    if len(i) == 0:
+        return i, j
+
+    overlap = obb_overlap(pos[i], heading[i], pos[j], heading[j], length, width)
+    return i[overlap], j[overlap]
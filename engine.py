@@ -0,0 +1,362 @@
+import importlib
+import math
+import numpy as np
+
+from collision import get_hits
+from geometry import get_degrees
+from reward_pool import (
+    DEFAULT_BACKEND,
+    RewardPool,
+    find_max_reward,
+)
+from raycast import LIDAR_BEAMS, LIDAR_RANGE, RayCaster
+from track_index import TrackIndex
+from track_query import WINDOW, TrackProjection, TrackQuery, closest_batch
+from tracing import NULL_TRACER
+
+# Constants
+TRACK = "jyllandsringen_pro_cw"
+REWARD_MODULE = "TwoDigitsOptimised"
+FRAME_RATE = 15  # fps - DeepRacer runs the function at 15 fps
+MIN_REWARD = 0.0001
+STEERING_ANGLE = [-30, -15, -5, 0, 5, 15, 30]
+SPEEDS = [2,3,4]
+DEFAULT_SPEED = 3.0
+BOTS_COUNT = 0
+BOTS_SPEED = 0
+WARNED_RATE = 1.5  # of track width to the closest bot
+LAP_WRAP = 50  # % of progress lost when passing the start line
+
+def load_reward_module(name):
+    '''Import a reward module from the functions package by name'''
+    return importlib.import_module("functions." + name)
+
+def get_waypoints(track, key):
+    '''Get list of waypoints of the track for the given key'''
+    if key == "center":
+        return track.get_center_waypoints()
+    elif key == "inside":
+        return track.get_inside_waypoints()
+    elif key == "outside":
+        return track.get_outside_waypoints()
+    elif key == "shortcut":
+        return track.get_shortcut_waypoints()
+    elif key in ["left", "left2", "right", "right2"]:
+        return track.get_geometry()[key].tolist()
+    return None
+
+def freeze(value):
+    '''Get a read only copy of nested lists as tuples'''
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+class CarModel:
+    '''Represents the kinematics of a car, without any drawing'''
+    def __init__(self, pos, angle, speed):
+        self.pos = [pos[0], pos[1]]
+        self.vel = [speed / FRAME_RATE, 0.0]
+        self.angle = angle * -1
+        self.rotate(angle)
+
+    def get_pos(self):
+        return self.pos
+
+    def get_angle(self):
+        return self.angle * -1
+
+    def rotate(self, angle):
+        '''Rotate the velocity counterclockwise by angle degrees'''
+        rad = math.radians(angle)
+        cos, sin = math.cos(rad), math.sin(rad)
+        x, y = self.vel
+        self.vel = [x * cos - y * sin, x * sin + y * cos]
+
+    def reset(self, pos, angle):
+        '''Place the car at pos heading towards angle, keeping its speed'''
+        speed = math.hypot(self.vel[0], self.vel[1])
+        self.pos = [pos[0], pos[1]]
+        self.vel = [speed, 0.0]
+        self.angle = angle * -1
+        self.rotate(angle)
+
+    def move(self, angle, paused=False):
+        angle *= -1
+
+        if not paused:
+            self.pos = [self.pos[0] + self.vel[0], self.pos[1] + self.vel[1]]
+
+            if abs(angle) > 0:
+                self.angle += angle
+                self.rotate(-angle)
+
+        if self.angle > 180:
+            self.angle = self.angle - 360
+        elif self.angle < -180:
+            self.angle = self.angle + 360
+
+        return self.pos, (self.angle * -1)
+
+class BotFleet:
+    '''Represents every bot as arrays, each following its lane, stepped all at once
+
+    A bot steers 15 degrees towards the lane waypoint 3 ahead of its closest one
+    when it points more than 15 degrees away from it, like a car would with
+    CarModel. The closest lane waypoints are searched in a window around the
+    previous ones, moved along the lane until they hold the closest waypoint.
+    '''
+    def __init__(self, lanes, lane_ids, start_indexes, speed, window=WINDOW):
+        self.lanes = np.asarray(lanes, dtype=float)  # lanes x waypoints x 2
+        self.lane_ids = np.asarray(lane_ids, dtype=int)
+        self.window = min(window, self.lanes.shape[1] // 2)
+
+        length = self.lanes.shape[1]
+        start_indexes = np.asarray(start_indexes, dtype=int)
+        start = self.lanes[self.lane_ids, start_indexes]
+        target = self.lanes[self.lane_ids, (start_indexes + 3) % length]
+
+        self.pos = start.copy()
+        self.heading = np.degrees(np.arctan2(target[:, 1] - start[:, 1], target[:, 0] - start[:, 0]))
+        rad = np.radians(self.heading)
+        self.vel = np.stack([np.cos(rad), np.sin(rad)], axis=1) * (speed / FRAME_RATE)
+
+        self.is_left = self.lane_ids == 0
+        self.closest_idx = None
+
+    def __len__(self):
+        return len(self.pos)
+
+    def update_closest(self):
+        '''Update the index of the closest waypoint of its lane for every bot'''
+        self.closest_idx = closest_batch(self.lanes[self.lane_ids], self.pos, self.closest_idx, self.window)[1]
+
+    def move(self, paused=False):
+        '''Steer and move every bot by one frame'''
+        self.update_closest()
+
+        length = self.lanes.shape[1]
+        target = self.lanes[self.lane_ids, (self.closest_idx + 3) % length]
+        target_angle = np.arctan2(target[:, 1] - self.pos[:, 1], target[:, 0] - self.pos[:, 0])
+
+        diff = (np.radians(self.heading) - target_angle) % (2.0 * np.pi)
+        diff = np.degrees(np.where(diff >= np.pi, diff - 2.0 * np.pi, diff))
+        steering = np.where(np.abs(diff) > 15, np.where(diff > 0, -15.0, 15.0), 0.0)
+
+        if not paused:
+            self.pos = self.pos + self.vel
+
+            rad = np.radians(steering)
+            cos, sin = np.cos(rad), np.sin(rad)
+            x, y = self.vel[:, 0], self.vel[:, 1]
+            self.vel = np.stack([x * cos - y * sin, x * sin + y * cos], axis=1)
+            self.heading = self.heading + steering
+
+        self.heading = np.where(self.heading < -180, self.heading + 360, self.heading)
+        self.heading = np.where(self.heading > 180, self.heading - 360, self.heading)
+
+def init_bots(track, bots_count, bots_speed):
+    '''Initialize the fleet of bots spread over the left and right lanes'''
+    lanes = [
+        get_waypoints(track, "left"),
+        get_waypoints(track, "right"),
+    ]
+    length = len(lanes[0])
+
+    lane_ids = [i % len(lanes) for i in range(bots_count)]
+    start_indexes = [int(length / (bots_count + 2)) * (i + 2) for i in range(bots_count)]
+
+    return BotFleet(lanes, lane_ids, start_indexes, bots_speed)
+
+class StepResult:
+    '''Represents everything that happened during one simulation step'''
+    def __init__(self, params, closest_idx, offtrack, crashed, warned, lap_completed, max_reward):
+        self.params = params
+        self.closest_idx = closest_idx
+        self.offtrack = offtrack
+        self.crashed = crashed
+        self.warned = warned
+        self.lap_completed = lap_completed
+        self.max_reward = max_reward
+
+class Simulation:
+    '''Steps the car, the bots and the reward function without any display'''
+    def __init__(self, track, reward_module, speed=DEFAULT_SPEED, bots_count=BOTS_COUNT, bots_speed=BOTS_SPEED,
+                 speeds=SPEEDS, steering_angles=STEERING_ANGLE, debug=False, backend=DEFAULT_BACKEND, workers=None,
+                 lidar_beams=LIDAR_BEAMS, lidar_range=LIDAR_RANGE, tracer=NULL_TRACER, reward_cache=None):
+        self.track = track
+        self.reward_module = reward_module
+        self.speeds = speeds
+        self.steering_angles = steering_angles
+        self.speed = speed
+        self.debug = debug
+        self.lidar_beams = lidar_beams
+        self.lidar_range = lidar_range
+        self.tracer = tracer
+
+        self.waypoints = get_waypoints(track, "center")
+        self.inside = get_waypoints(track, "inside")
+        self.outside = get_waypoints(track, "outside")
+        geometry = track.get_geometry()
+        self.track_width = float(geometry["widths"][0])
+        self.raycaster = RayCaster(geometry["inside"], geometry["outside"], geometry["wall_starts"], geometry["wall_ends"])
+        self.track_index = TrackIndex(geometry)
+
+        # shared by the params of every step
+        self.frozen_waypoints = freeze(self.waypoints)
+
+        self.pool = RewardPool(reward_module, self.get_static_params(), backend, workers, reward_cache)
+
+        car_angle = get_degrees(self.waypoints[0], self.waypoints[1])
+        self.car = CarModel(self.waypoints[0], car_angle, speed)
+        self.query = TrackQuery(self.waypoints)
+        self.projection = TrackProjection(geometry)
+        self.closest_idx = None
+        self.segment_idx = None
+        self.bots = init_bots(track, bots_count, bots_speed)
+
+        self.steps = 0
+        self.lap_steps = 0
+        self.prev_progress = 100
+
+    def get_static_params(self):
+        '''Get the params that stay the same for every step'''
+        return {
+            "track_width": self.track_width,
+            "waypoints": self.frozen_waypoints,
+        }
+
+    def close(self):
+        '''Release the reward workers'''
+        self.pool.close()
+
+    def reset_car(self, closest_idx):
+        '''Put the car back on the center line at the given waypoint'''
+        target_idx = (closest_idx + 1) % len(self.waypoints)
+        angle = get_degrees(self.waypoints[closest_idx], self.waypoints[target_idx])
+        self.car.reset(self.waypoints[closest_idx], angle)
+        self.closest_idx = closest_idx
+        self.segment_idx = closest_idx
+
+    def pick_action(self, params):
+        '''Run the reward function for every action and pick the best one'''
+        rewards = self.pool.evaluate(params, self.speeds, self.steering_angles)
+        return find_max_reward(rewards, self.speeds, self.steering_angles)
+
+    def step(self, paused=False):
+        '''Advance the simulation by one frame'''
+        waypoints = self.waypoints
+
+        # car
+        pos = self.car.get_pos()
+        heading = self.car.get_angle()
+
+        # closest
+        with self.tracer.span("step.closest"):
+            closest_idx = self.query.closest(pos, self.closest_idx)[1]
+            segment_idx, arc_length, offset = self.projection.project_one(pos, self.segment_idx)
+        self.closest_idx = closest_idx
+        self.segment_idx = segment_idx
+        waypoints_length = len(waypoints)
+
+        # the waypoints before and after the car, like DeepRacer
+        closest_waypoints = [segment_idx, (segment_idx + 1) % waypoints_length]
+
+        # progress, along the center line
+        progress = self.projection.get_progress(arc_length)
+        lap_completed = False
+        # Only passing the start line ends a lap, not a car put back a few waypoints
+        if self.steps > 0 and self.prev_progress - progress > LAP_WRAP:
+            lap_completed = True
+            self.lap_steps = self.steps
+            self.steps = 0
+        self.steps += 1
+        self.prev_progress = progress
+
+        if self.debug:
+            print("")
+            print("run", self.steps, progress)
+
+        # Off track, like DeepRacer once no wheel is on the track
+        wheels_inside = self.track_index.wheels_inside(pos, heading)[0]
+        all_wheels_on_track = bool(wheels_inside.all())
+        offtrack = not wheels_inside.any()
+        if offtrack:
+            paused = True
+
+        # is_left, of the direction of travel
+        is_left_of_center = offset > 0
+
+        # objects
+        closest_objects = []
+        objects_location = []
+        objects_distance = []
+        objects_left_of_center = []
+
+        crashed = False
+        warned = False
+
+        if len(self.bots) > 0:
+            with self.tracer.span("step.bots"):
+                self.bots.move(paused)
+
+                bots_pos = self.bots.pos
+                bots_distance = np.hypot(bots_pos[:, 0] - pos[0], bots_pos[:, 1] - pos[1])
+                bot_idx = int(np.argmin(bots_distance))
+
+                objects_location = bots_pos.tolist()
+                objects_distance = bots_distance.tolist()
+                objects_left_of_center = self.bots.is_left.astype(int).tolist()
+
+                # only the bots close enough get the exact test
+                crashed = bool(get_hits(pos, heading, bots_pos, self.bots.heading).any())
+
+            closest_objects = objects_location[bot_idx]
+
+            if objects_distance[bot_idx] < (self.track_width * WARNED_RATE):
+                warned = True
+
+        params = {
+            "all_wheels_on_track": all_wheels_on_track,
+            "closest_objects": freeze(closest_objects),
+            "closest_waypoints": freeze(closest_waypoints),
+            "is_crashed": crashed,
+            "distance_from_center": abs(offset),
+            "heading": heading,
+            "is_left_of_center": is_left_of_center,
+            "is_reversed": False,
+            "objects_distance": freeze(objects_distance),
+            "objects_left_of_center": freeze(objects_left_of_center),
+            "objects_location": freeze(objects_location),
+            "is_offtrack": offtrack,
+            "progress": progress,
+            "speed": self.speed,
+            "steering_angle": 0,
+            "steps": self.steps,
+            "track_width": self.track_width,
+            "waypoints": self.frozen_waypoints,
+            "x": pos[0],
+            "y": pos[1],
+        }
+
+        if self.lidar_beams > 0:
+            with self.tracer.span("step.lidar"):
+                lidar = self.raycaster.sense(pos, heading, self.lidar_beams, self.lidar_range, objects=objects_location)
+            params["lidar"] = tuple(lidar.tolist())
+
+        # pick target
+        max_reward = None
+        angle = 0
+
+        if not paused:
+            with self.tracer.span("step.reward"):
+                max_reward = self.pick_action(params)
+            angle = max_reward["angle"]
+
+            if self.debug:
+                print("pick {}".format(max_reward))
+
+        # moving
+        self.car.move(angle, paused)
+
+        return StepResult(params, closest_idx, offtrack, crashed, warned, lap_completed, max_reward)
+
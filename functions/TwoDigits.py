@@ -1,5 +1,13 @@
 import math
 
+# Params the reward depends on and their quantization step, for reward_cache.py
+REWARD_CACHE_KEYS = {
+    "x": 0.02,
+    "y": 0.02,
+    "heading": 0.5,
+    "is_reversed": None,
+}
+
 
 def dist(point1, point2):
     return ((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2) ** 0.5
@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from scipy.spatial import KDTree
 
 SHOULD_LOG = False
 
@@ -95,6 +94,8 @@ def get_target_point(params):
         waypoints = up_sample(get_waypoints_ordered_in_driving_direction(params), 20)
 
     if kdtree is None:
+        # scipy takes long to import, only pay for it once the module is used
+        from scipy.spatial import KDTree
         kdtree = KDTree(waypoints)
 
     car = [params["x"], params["y"]]
@@ -148,4 +149,23 @@ def score_steer_to_point_ahead(params):
 
 
 def reward_function(params):
-    return float(score_steer_to_point_ahead(params))
\ No newline at end of file
+    return float(score_steer_to_point_ahead(params))
+
+
+def reward_function_batch(params, speeds, steering_angles):
+    """
+    Scores every speed and steering angle at once
+    The target point only depends on the car position, so it is found once.
+    :param params: the DeepRacer params
+    :param speeds: numpy array of speeds
+    :param steering_angles: numpy array of steering angles in degrees
+    :return: numpy array; one row per speed and one column per steering angle
+    """
+
+    best_steering_angle = get_target_steering_degree(params)
+
+    error = (steering_angles - best_steering_angle) / 60.0
+
+    scores = np.maximum(1.0 - np.abs(error), 0.01)
+
+    return np.tile(scores, (len(speeds), 1))
@@ -0,0 +1,72 @@
+import math
+
+def get_distance(coordinate1, coordinate2):
+    '''Get distance between two points'''
+    return math.sqrt(
+        (coordinate1[0] - coordinate2[0]) *
+        (coordinate1[0] - coordinate2[0]) +
+        (coordinate1[1] - coordinate2[1]) *
+        (coordinate1[1] - coordinate2[1]))
+
+def get_target(pos, angle, dist):
+    '''Get target point from position, angle and distance'''
+    return [
+        dist * math.cos(math.radians(angle)) + pos[0],
+        dist * math.sin(math.radians(angle)) + pos[1],
+    ]
+
+def degrees(angle):
+    '''Get angle in degrees'''
+    if angle > 180:
+        angle -= 360
+    if angle < -180:
+        angle += 360
+    return angle
+
+def get_radians(coordinate1, coordinate2):
+    '''Get angle between two coordinates in radians'''
+    return math.atan2((coordinate2[1] - coordinate1[1]), (coordinate2[0] - coordinate1[0]))
+
+def get_degrees(coordinate1, coordinate2):
+    '''Get angle between two coordinates in degrees'''
+    return degrees(math.degrees(get_radians(coordinate1, coordinate2)))
+
+def get_diff_radians(angle1, angle2):
+    '''Get difference between two angles in radians'''
+    diff = (angle1 - angle2) % (2.0 * math.pi)
+    if diff >= math.pi:
+        diff -= 2.0 * math.pi
+    return diff
+
+def get_diff_degrees(angle1, angle2):
+    '''Get difference between two angles in degrees'''
+    return degrees(math.degrees(get_diff_radians(angle1, angle2)))
+
+def get_distance_list(pos, waypoints):
+    '''Get distance between position and each waypoint'''
+    dist_list = []
+    min_dist = float("inf")
+    min_idx = -1
+
+    for i, p in enumerate(waypoints):
+        dist = get_distance(pos, p)
+        if dist < min_dist:
+            min_dist = dist
+            min_idx = i
+        dist_list.append(dist)
+
+    return dist_list, min_dist, min_idx, len(waypoints)
+
+def get_angle_list(pos, waypoints):
+    '''Get angle between position and each waypoint'''
+    angle_list = []
+    dist_list = []
+
+    for _, waypoint in enumerate(waypoints):
+        angle = get_degrees(pos, waypoint)
+        angle_list.append(angle)
+
+        dist = get_distance(pos, waypoint)
+        dist_list.append(dist)
+
+    return angle_list, dist_list, len(waypoints)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import time
+
+from track_loader import Track_Loader
+
+from engine import (
+    BOTS_COUNT,
+    BOTS_SPEED,
+    DEFAULT_SPEED,
+    FRAME_RATE,
+    REWARD_MODULE,
+    TRACK,
+    Simulation,
+    load_reward_module,
+)
+from raycast import LIDAR_BEAMS, LIDAR_RANGE
+from recorder import TraceRecorder
+from reward_cache import CACHE_SIZE, get_reward_cache
+from reward_pool import BACKENDS, DEFAULT_BACKEND
+from tracing import get_tracer
+
+# Constants
+TITLE = "DeepRacer Headless Simulator"
+DEBUG_LOG = False
+LAPS = 1
+MAX_STEPS = 15000  # about 16 minutes of simulated time
+
+def parse_args():
+    params = argparse.ArgumentParser(description=TITLE)
+    params.add_argument("-t", "--track", default=TRACK, help="track name in routes")
+    params.add_argument("-r", "--reward-module", default=REWARD_MODULE, help="reward module name in functions")
+    params.add_argument("-s", "--speed", type=float, default=DEFAULT_SPEED, help="speed")
+    params.add_argument("-l", "--laps", type=int, default=LAPS, help="laps to drive")
+    params.add_argument("--max-steps", type=int, default=MAX_STEPS, help="max steps before giving up")
+    params.add_argument("--bots-count", type=int, default=BOTS_COUNT, help="bots count")
+    params.add_argument("--bots-speed", type=float, default=BOTS_SPEED, help="bots speed")
+    params.add_argument("--backend", default=DEFAULT_BACKEND, choices=BACKENDS, help="reward workers backend")
+    params.add_argument("--workers", type=int, default=None, help="reward workers count")
+    params.add_argument("--lidar-beams", type=int, default=LIDAR_BEAMS, help="lidar beams in params, 0 for none")
+    params.add_argument("--lidar-range", type=float, default=LIDAR_RANGE, help="lidar range")
+    params.add_argument("--reward-cache", default=False, action="store_true", help="memoize rewards on the REWARD_CACHE_KEYS of the module")
+    params.add_argument("--reward-cache-size", type=int, default=CACHE_SIZE, help="rewards kept in the cache")
+    params.add_argument("--reward-cache-persist", default=False, action="store_true", help="keep the cache between runs, per module and track")
+    params.add_argument("--record", default=None, help="directory to record every step to, see recorder.py")
+    params.add_argument("--trace", default=None, help="json file to write the Chrome trace of the step phases to")
+    params.add_argument("--debug", default=DEBUG_LOG, action="store_true", help="debug")
+    return params.parse_args()
+
+def run_headless(sim, laps=LAPS, max_steps=MAX_STEPS, recorder=None):
+    '''Drive the simulation as fast as possible and return the summary'''
+    lap_times = []
+    total_reward = float(0)
+    offtrack_count = 0
+    crashed_count = 0
+    steps = 0
+    progress = 0
+
+    tracer = sim.tracer
+    start_time = time.perf_counter()
+
+    while len(lap_times) < laps and steps < max_steps:
+        with tracer.span("step"):
+            result = sim.step()
+        tracer.end_frame()
+        steps += 1
+
+        if recorder is not None:
+            recorder.record(sim, result)
+
+        if result.lap_completed:
+            lap_times.append(sim.lap_steps / FRAME_RATE)
+
+        progress = result.params["progress"]
+
+        if result.crashed:
+            crashed_count += 1
+
+        if result.offtrack:
+            # Like the DeepRacer evaluation, put the car back on the track
+            offtrack_count += 1
+            sim.reset_car(result.closest_idx)
+            continue
+
+        total_reward += result.max_reward["reward"]
+
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "lap_times": lap_times,
+        "total_reward": total_reward,
+        "offtrack_count": offtrack_count,
+        "crashed_count": crashed_count,
+        "progress": progress,
+        "steps": steps,
+        "elapsed": elapsed,
+        "steps_per_sec": steps / elapsed if elapsed > 0 else float("inf"),
+    }
+
+def print_summary(summary):
+    '''Print the summary of a headless run'''
+    for i, lap_time in enumerate(summary["lap_times"]):
+        print("lap {} {:3.3f}".format(i + 1, lap_time))
+    print("total_reward {:3f}".format(summary["total_reward"]))
+    print("offtrack {}".format(summary["offtrack_count"]))
+    print("crashed {}".format(summary["crashed_count"]))
+    print("steps {} in {:3.3f}s ({:.0f} steps/sec)".format(summary["steps"], summary["elapsed"], summary["steps_per_sec"]))
+
+def run():
+    '''Main run function without a display'''
+    args = parse_args()
+
+    track = Track_Loader(args.track)
+    reward_module = load_reward_module(args.reward_module)
+    tracer = get_tracer(args.trace is not None)
+
+    reward_cache = None
+    if args.reward_cache:
+        reward_cache = get_reward_cache(reward_module, args.track, args.reward_cache_size, args.reward_cache_persist)
+        if reward_cache is None:
+            print("reward", args.reward_module, "declares no REWARD_CACHE_KEYS, running without a cache")
+
+    sim = Simulation(track, reward_module, args.speed, args.bots_count, args.bots_speed, debug=args.debug,
+                     backend=args.backend, workers=args.workers, lidar_beams=args.lidar_beams, lidar_range=args.lidar_range,
+                     tracer=tracer, reward_cache=reward_cache)
+
+    recorder = None
+    if args.record:
+        recorder = TraceRecorder(args.record, args.track, args.reward_module, args.bots_count)
+
+    try:
+        summary = run_headless(sim, args.laps, args.max_steps, recorder)
+    finally:
+        sim.close()
+        if recorder is not None:
+            recorder.close()
+
+    print("track", args.track, "reward", args.reward_module)
+    print_summary(summary)
+
+    if reward_cache is not None:
+        reward_cache.print_stats()
+        reward_cache.save()
+
+    if args.trace:
+        tracer.print_summary()
+        tracer.save(args.trace)
+        print("trace", args.trace)
+
+if __name__ == "__main__":
+    run()
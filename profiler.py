@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import cProfile
+import importlib
+import pstats
+import time
+import numpy as np
+
+from track_loader import Track_Loader
+
+from batch import format_value, get_reward_module_names, match_names
+from engine import (
+    DEFAULT_SPEED,
+    SPEEDS,
+    STEERING_ANGLE,
+    TRACK,
+    Simulation,
+    load_reward_module,
+)
+from headless import LAPS, MAX_STEPS, run_headless
+from tracing import FRAME_BUDGET
+
+# Constants
+TITLE = "DeepRacer Reward Function Profiler"
+CANDIDATES = len(SPEEDS) * len(STEERING_ANGLE)  # reward calls per step
+HISTOGRAM_BINS = np.concatenate([[0], np.logspace(-7, 0, 22), [np.inf]])  # seconds, 100ns to 1s, and any faster or slower
+HISTOGRAM_WIDTH = 40
+TOP_FUNCTIONS = 10
+COLUMNS = ["rank", "reward_module", "calls", "mean_us", "p50_us", "p99_us", "max_us", "step_p99_ms", "budget", "error"]
+
+def parse_args():
+    params = argparse.ArgumentParser(description=TITLE)
+    params.add_argument("-t", "--track", default=TRACK, help="track name in routes")
+    params.add_argument("-r", "--reward-modules", nargs="+", default=["*"], help="reward module names or globs")
+    params.add_argument("-s", "--speed", type=float, default=DEFAULT_SPEED, help="speed")
+    params.add_argument("-l", "--laps", type=int, default=LAPS, help="laps to drive")
+    params.add_argument("--max-steps", type=int, default=MAX_STEPS, help="max steps before giving up")
+    params.add_argument("--no-cprofile", default=False, action="store_true", help="only time the calls, skip the cProfile run")
+    params.add_argument("--top", type=int, default=TOP_FUNCTIONS, help="internal functions listed per module")
+    return params.parse_args()
+
+class RewardProfiler:
+    '''Stands in for a reward module, timing every call of its reward_function
+
+    It has no reward_function_batch, so the simulator calls reward_function once per
+    candidate, like DeepRacer does.
+    '''
+    def __init__(self, reward_module, profile=None):
+        self.reward_module = reward_module
+        self.__name__ = reward_module.__name__
+        self.profile = profile
+        self.latencies = []
+
+    def reward_function(self, params):
+        if self.profile is not None:
+            return self.profile.runcall(self.reward_module.reward_function, params)
+
+        start = time.perf_counter()
+        reward = self.reward_module.reward_function(params)
+        self.latencies.append(time.perf_counter() - start)
+        return reward
+
+    def get_latencies(self):
+        return np.array(self.latencies)
+
+    def get_step_latencies(self, candidates=CANDIDATES):
+        '''Get the time spent on all the candidates of each step'''
+        latencies = self.get_latencies()
+        steps = len(latencies) // candidates
+        return latencies[:steps * candidates].reshape(steps, candidates).sum(axis=1)
+
+def drive(track, reward_module, speed, laps, max_steps, profile=None):
+    '''Drive the track headless with the reward module wrapped by a profiler'''
+    profiler = RewardProfiler(reward_module, profile)
+    sim = Simulation(track, profiler, speed)
+    try:
+        run_headless(sim, laps, max_steps)
+    finally:
+        sim.close()
+    return profiler
+
+def profile_module(track, module_name, speed, laps, max_steps, cprofile=True):
+    '''Time every reward call of one module, then drive again under cProfile'''
+    row = {"reward_module": module_name}
+
+    try:
+        # Reward modules keep state in globals, both runs start from a fresh one
+        reward_module = importlib.reload(load_reward_module(module_name))
+        profiler = drive(track, reward_module, speed, laps, max_steps)
+
+        if cprofile:
+            profile = cProfile.Profile()
+            reward_module = importlib.reload(reward_module)
+            drive(track, reward_module, speed, laps, max_steps, profile)
+            row["stats"] = pstats.Stats(profile)
+    except Exception as ex:
+        row["error"] = repr(ex)
+        return row
+
+    latencies = profiler.get_latencies()
+    step_latencies = profiler.get_step_latencies()
+    if len(latencies) == 0:
+        row["error"] = "no reward calls"
+        return row
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+
+    row["calls"] = len(latencies)
+    row["mean_us"] = float(latencies.mean() * 1e6)
+    row["p50_us"] = float(p50)
+    row["p99_us"] = float(p99)
+    row["max_us"] = float(latencies.max() * 1e6)
+    row["histogram"] = get_histogram(latencies)
+
+    if len(step_latencies) > 0:
+        step_p99 = float(np.percentile(step_latencies, 99))
+        row["step_p99_ms"] = step_p99 * 1e3
+        row["budget"] = "over" if step_p99 > FRAME_BUDGET else "ok"
+
+    return row
+
+def get_histogram(latencies):
+    '''Count the calls per latency bin, the first and last bins take the calls out of the 100ns to 1s range'''
+    return np.histogram(latencies, HISTOGRAM_BINS)[0]
+
+def format_seconds(seconds):
+    if seconds == np.inf:
+        return "inf"
+    if seconds < 1e-6:
+        return "{:.0f}ns".format(seconds * 1e9)
+    if seconds < 1e-3:
+        return "{:.0f}us".format(seconds * 1e6)
+    if seconds < 1:
+        return "{:.0f}ms".format(seconds * 1e3)
+    return "{:.0f}s".format(seconds)
+
+def print_histogram(histogram):
+    '''Print the latency histogram, one line per bin that has calls'''
+    most = max(histogram.max(), 1)
+    for count, low, high in zip(histogram, HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:]):
+        if count > 0:
+            bar = "#" * max(int(count / most * HISTOGRAM_WIDTH), 1)
+            print("  {:>6} - {:<6} {:>8}  {}".format(format_seconds(low), format_seconds(high), count, bar))
+
+def print_module(row, top):
+    '''Print the latency histogram and the slowest internal functions of a module'''
+    print("reward_module", row["reward_module"])
+
+    if "error" in row:
+        print("  failed", row["error"])
+        return
+
+    print("  calls {}  mean {:.1f}us  p50 {:.1f}us  p99 {:.1f}us  max {:.1f}us".format(
+        row["calls"], row["mean_us"], row["p50_us"], row["p99_us"], row["max_us"]))
+    print_histogram(row["histogram"])
+
+    if row.get("budget") == "over":
+        print("  WARNING p99 of {} candidates {:.1f}ms exceeds the {:.1f}ms frame budget".format(
+            CANDIDATES, row["step_p99_ms"], FRAME_BUDGET * 1e3))
+
+    if "stats" in row:
+        print("  cumulative time per function:")
+        row["stats"].sort_stats("cumulative").print_stats(top)
+
+def print_ranking(rows):
+    '''Print every module ranked from the slowest step p99'''
+    rows = sorted(rows, key=lambda row: ("error" in row, -row.get("step_p99_ms", 0)))
+    table = [COLUMNS]
+    for rank, row in enumerate(rows):
+        table.append([str(rank + 1)] + [format_value(row.get(column)) for column in COLUMNS[1:]])
+
+    widths = [max(len(line[i]) for line in table) for i in range(len(COLUMNS))]
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+
+def run():
+    '''Profile the reward modules one after the other, so they do not share the CPU'''
+    args = parse_args()
+
+    track = Track_Loader(args.track)
+    modules = match_names(args.reward_modules, get_reward_module_names())
+
+    rows = []
+    for module_name in modules:
+        row = profile_module(track, module_name, args.speed, args.laps, args.max_steps, not args.no_cprofile)
+        print_module(row, args.top)
+        rows.append(row)
+
+    print("track", args.track, "frame budget {:.1f}ms for {} candidates".format(FRAME_BUDGET * 1e3, CANDIDATES))
+    print_ranking(rows)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+import numpy as np
+
+from track_cache import (
+    build_routes,
+    get_curvature,
+    get_point_curvature,
+    get_route_hash,
+    get_route_names,
+    get_route_params,
+    load_track_geometry,
+    save_arrays,
+)
+from track_index import WHEEL_TRACK, WHEELBASE
+
+# Constants
+TITLE = "DeepRacer Racing Line"
+CACHE_DIR = "./cache/racinglines/"
+LINE_VERSION = 2  # bump when the optimizer changes
+LINE_ITERATIONS = 2000
+LINE_MARGIN = np.hypot(WHEELBASE, WHEEL_TRACK) / 2  # meters kept from the borders, so the wheels stay on the track at any heading
+LINE_DELTA = 1e-3  # of the half width, lateral move to measure how the curvature changes
+LINE_RELAX = 0.5  # of the Newton step, the full step overshoots and zig-zags
+LINE_MAX_STEP = 0.05  # of the spacing between waypoints, the most a point moves per iteration
+MAX_SPEED = 4.0  # m/s
+MIN_SPEED = 1.3  # m/s
+LATERAL_ACCEL = 3.0  # m/s2, the grip in corners
+ACCEL = 2.0  # m/s2
+BRAKE = 3.0  # m/s2
+
+def get_cache_path(route):
+    return CACHE_DIR + "{}-{}-v{}".format(route, get_route_hash(route), LINE_VERSION)
+
+def get_borders(geometry):
+    '''Get the inside and outside borders, without the last waypoint when it closes the loop'''
+    inside = np.asarray(geometry["inside"], dtype=float)
+    outside = np.asarray(geometry["outside"], dtype=float)
+    center = np.asarray(geometry["center"], dtype=float)
+    if len(center) > 3 and np.allclose(center[0], center[-1]):
+        inside, outside = inside[:-1], outside[:-1]
+    return inside, outside
+
+def optimize_line(inside, outside, iterations=LINE_ITERATIONS, margin=LINE_MARGIN):
+    '''Get the racing line between the borders, by K1999 curvature smoothing
+
+    Every point moves across the track until the curvature there is the mean of
+    the curvatures at its neighbours, within margin of the borders. The even and
+    the odd points take turns, each half at once, so a point never moves together
+    with its neighbours. The steps are damped and capped, as a point far from the
+    neighbours it is smoothed against is pulled hard.
+    '''
+    middle = (inside + outside) / 2
+    half = (inside - outside) / 2  # from the middle to the inside border
+    half_width = np.hypot(*half.T)
+    limit = np.clip(1 - margin / np.maximum(half_width, 1e-9), 0, 1)
+
+    spacing = np.hypot(*(np.roll(middle, -1, axis=0) - middle).T)
+    max_step = LINE_MAX_STEP * np.minimum(spacing, np.roll(spacing, 1)) / np.maximum(half_width, 1e-9)
+
+    count = len(middle)
+    lateral = np.zeros(count)
+    halves = [np.arange(0, count, 2), np.arange(1, count, 2)]
+    if count % 2 == 1:
+        # the last point is a neighbour of the first one
+        halves = [halves[0][:-1], halves[1], halves[0][-1:]]
+
+    for _ in range(iterations):
+        for idx in halves:
+            line = middle + lateral[:, None] * half
+            prev_points = line[idx - 1]
+            next_points = line[(idx + 1) % count]
+
+            curvature = get_curvature(line)
+            target = (curvature[idx - 1] + curvature[(idx + 1) % count]) / 2
+            moved = get_point_curvature(prev_points, line[idx] + LINE_DELTA * half[idx], next_points)
+            slope = (moved - curvature[idx]) / LINE_DELTA
+
+            step = np.divide(target - curvature[idx], slope, out=np.zeros(len(idx)), where=np.abs(slope) > 1e-9)
+            step = np.clip(LINE_RELAX * step, -max_step[idx], max_step[idx])
+            lateral[idx] = np.clip(lateral[idx] + step, -limit[idx], limit[idx])
+
+    return middle + lateral[:, None] * half
+
+def get_speeds(line, max_speed=MAX_SPEED, min_speed=MIN_SPEED, lateral_accel=LATERAL_ACCEL, accel=ACCEL, brake=BRAKE):
+    '''Get the speed at each point of a closed line, from the grip in its corners and how fast the car speeds up and brakes'''
+    curvature = np.abs(get_curvature(line))
+    with np.errstate(divide="ignore"):
+        speeds = np.clip(np.sqrt(lateral_accel / curvature), min_speed, max_speed)
+
+    count = len(line)
+    distances = np.hypot(*(line - np.roll(line, 1, axis=0)).T)  # from the previous point
+
+    # over 2 laps, so the end of a lap limits its start
+    laps_speeds = np.tile(speeds, 2)
+    arc = np.cumsum(np.tile(distances, 2))
+
+    # v^2 <= u^2 + 2 a s from any point behind, and from any point ahead when braking,
+    # a whole lap of them for the second lap and the first lap respectively
+    squared = laps_speeds ** 2
+    from_behind = np.minimum.accumulate(squared - 2 * accel * arc) + 2 * accel * arc
+    from_ahead = np.minimum.accumulate((squared + 2 * brake * arc)[::-1])[::-1] - 2 * brake * arc
+
+    return np.sqrt(np.minimum(from_behind[count:], from_ahead[:count]))
+
+def get_racing_track(line, speeds):
+    '''Get the rows of x, y, speed and the time from the previous point, like the racing_track of hsbc'''
+    distances = np.hypot(*(line - np.roll(line, 1, axis=0)).T)
+    return np.column_stack([line, speeds, distances / speeds])
+
+def compute_racing_track(route, iterations=LINE_ITERATIONS):
+    '''Optimize the racing line of a route and its speeds'''
+    inside, outside = get_borders(load_track_geometry(route))
+    line = optimize_line(inside, outside, iterations)
+    return get_racing_track(line, get_speeds(line))
+
+def build_racing_track(route, force=False):
+    '''Compute the racing track of a route into the cache unless it is already there, and get its path'''
+    path = get_cache_path(route)
+    if os.path.isdir(path) and not force:
+        return path
+    return save_arrays(path, {"racing_track": compute_racing_track(route)}, force)
+
+def load_racing_track(route):
+    '''Get the racing track of a route, rows of x, y, speed and time, computing it when needed'''
+    return np.load(os.path.join(build_racing_track(route), "racing_track.npy"))
+
+def print_table(route, racing_track):
+    '''Print the racing track as a literal to paste into a reward function'''
+    lap_time = racing_track[:, 3].sum()
+    print("# {} racing line, {} points, {:.3f}s per lap".format(route, len(racing_track), lap_time))
+    print("racing_track = [")
+    for x, y, speed, time in racing_track.tolist():
+        print("    [{:.5f}, {:.5f}, {:.5f}, {:.5f}],".format(x, y, speed, time))
+    print("]")
+
+def parse_args():
+    params = get_route_params(TITLE)
+    params.add_argument("--table", default=False, action="store_true", help="print the racing track of each route as a literal")
+    return params.parse_args()
+
+def run():
+    '''Build the racing line of every route in parallel'''
+    args = parse_args()
+
+    routes = args.routes or get_route_names()
+
+    for route, path in build_routes(functools.partial(build_racing_track, force=args.force), routes, args.workers):
+        if args.table:
+            print_table(route, load_racing_track(route))
+        else:
+            print(route, path)
+
+    if not args.table:
+        print("built", len(routes), "racing lines in", CACHE_DIR)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,121 @@
+import numpy as np
+
+from geometry import get_degrees
+
+# Constants
+LIDAR_BEAMS = 0  # no sensor
+LIDAR_FOV = 360  # degrees around the heading
+LIDAR_RANGE = 5.0  # meters
+BOT_RADIUS = 0.15  # meters, bots are seen as circles
+
+def wrap_degrees(angles):
+    '''Get angles in degrees, for arrays'''
+    angles = np.where(angles > 180, angles - 360, angles)
+    return np.where(angles < -180, angles + 360, angles)
+
+def cast_rays(pos, angles, starts, ends, dist):
+    '''Get the distance along each ray to the closest segment, inf when none is hit'''
+    rad = np.radians(angles)
+    dx = (np.cos(rad) * dist)[:, None]
+    dy = (np.sin(rad) * dist)[:, None]
+
+    sx = ends[:, 0] - starts[:, 0]
+    sy = ends[:, 1] - starts[:, 1]
+    qx = pos[0] - starts[:, 0]
+    qy = pos[1] - starts[:, 1]
+
+    # Same as intersection, for every ray and segment at once
+    det = dx * sy - dy * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (qy * sx - qx * sy) / det
+        u = (dx * qy - dy * qx) / det
+
+    hit = (det != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return np.where(hit, t, np.inf).min(axis=1) * dist
+
+def cast_rays_circles(pos, angles, centers, radius):
+    '''Get the distance along each ray to the closest circle, inf when none is hit'''
+    if len(centers) == 0:
+        return np.full(len(angles), np.inf)
+
+    rad = np.radians(angles)
+    dx = np.cos(rad)[:, None]
+    dy = np.sin(rad)[:, None]
+
+    cx = centers[:, 0] - pos[0]
+    cy = centers[:, 1] - pos[1]
+
+    proj = dx * cx + dy * cy
+    perp = (cx * cx + cy * cy) - proj * proj
+    half = np.sqrt(np.maximum(radius * radius - perp, 0))
+
+    hit = (perp <= radius * radius) & (proj + half >= 0)
+    dist = np.maximum(proj - half, 0)
+    return np.where(hit, dist, np.inf).min(axis=1)
+
+class RayCaster:
+    '''Casts rays against the walls of a track, with the wall segments precomputed'''
+    def __init__(self, inside, outside, wall_starts=None, wall_ends=None):
+        self.inside = np.asarray(inside, dtype=float)
+        self.outside = np.asarray(outside, dtype=float)
+
+        if wall_starts is None or wall_ends is None:
+            wall_starts = np.concatenate([self.inside, self.outside])
+            wall_ends = np.concatenate([np.roll(self.inside, -1, axis=0), np.roll(self.outside, -1, axis=0)])
+        self.wall_starts = np.asarray(wall_starts)
+        self.wall_ends = np.asarray(wall_ends)
+        self.max_wall_length = np.hypot(*(self.wall_ends - self.wall_starts).T).max()
+
+    def get_collision(self, pos, angles, walls, dist):
+        '''Get the furthest of the closest wall hits of the rays inside the walls'''
+        left_angle = get_degrees(pos, walls[0])
+        right_angle = get_degrees(pos, walls[-1])
+
+        diff_left = wrap_degrees(angles - left_angle)
+        diff_right = wrap_degrees(angles - right_angle)
+        angles = angles[(diff_left < 0) & (diff_right > 0)]
+
+        dists = cast_rays(pos, angles, walls[:-1], walls[1:], dist)
+        dists = np.where(np.isfinite(dists), dists, -np.inf)
+        if len(dists) == 0 or not np.isfinite(dists.max()):
+            return None
+
+        i = np.argmax(dists)
+        rad = np.radians(angles[i])
+        return (pos[0] + np.cos(rad) * dists[i], pos[1] + np.sin(rad) * dists[i])
+
+    def find_destination(self, pos, heading, closest_idx, track_width):
+        '''Find the furthest point the car can see along the track ahead'''
+        length = len(self.inside)
+        start_idx = (closest_idx + 1) % length
+        length_cut = length // 5
+        sight_dist = track_width * 20
+
+        idx = (start_idx + np.arange(length_cut)) % length
+        walls = np.concatenate([self.inside[idx], self.outside[idx][::-1]])
+
+        angles = wrap_degrees(heading + np.arange(-60, 60, dtype=float))
+        dest = self.get_collision(pos, angles, walls, sight_dist)
+
+        if dest is not None:
+            angle = get_degrees(pos, dest)
+            angles = wrap_degrees(np.arange(int((angle - 2) * 10), int((angle + 2) * 10)) / 10)
+            dest = self.get_collision(pos, angles, walls, sight_dist)
+
+        return dest
+
+    def get_lidar_angles(self, heading, beams, fov=LIDAR_FOV):
+        '''Get the angles of the beams spread evenly over the field of view'''
+        return wrap_degrees(heading + np.linspace(-fov / 2, fov / 2, beams, endpoint=fov < 360))
+
+    def sense(self, pos, heading, beams, max_range=LIDAR_RANGE, fov=LIDAR_FOV, objects=()):
+        '''Get the distance of each beam, from -fov/2 to fov/2 off the heading, to the walls or a bot'''
+        angles = self.get_lidar_angles(heading, beams, fov)
+
+        # Only the walls that can be in range
+        near = np.hypot(self.wall_starts[:, 0] - pos[0], self.wall_starts[:, 1] - pos[1]) <= max_range + self.max_wall_length
+
+        dists = cast_rays(pos, angles, self.wall_starts[near], self.wall_ends[near], max_range)
+        dists = np.minimum(dists, cast_rays_circles(pos, angles, np.array(objects, dtype=float).reshape(-1, 2), BOT_RADIUS))
+
+        return np.minimum(dists, max_range)
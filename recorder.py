@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+# Constants
+TITLE = "DeepRacer Trace Reader"
+TRACE_VERSION = 1
+META_FILE = "meta.json"
+CHUNK_FILE = "chunk-{:06d}.bin"
+BLOCK_STEPS = 1024  # steps handed to the writer thread at once
+CHUNK_STEPS = 1 << 20  # steps per chunk file
+QUEUE_BLOCKS = 8  # blocks waiting for the writer before record blocks
+
+def get_step_dtype(bots_count):
+    '''Get the fixed-width record of one step, with the x, y and heading of every bot'''
+    return np.dtype([
+        ("step", "i4"),
+        ("x", "f4"),
+        ("y", "f4"),
+        ("heading", "f4"),
+        ("closest_idx", "i4"),
+        ("progress", "f4"),
+        ("speed", "f4"),  # nan when paused
+        ("steering_angle", "f4"),  # nan when paused
+        ("reward", "f4"),  # nan when paused
+        ("offtrack", "?"),
+        ("crashed", "?"),
+        ("warned", "?"),
+        ("lap_completed", "?"),
+        ("bots", "f4", (bots_count, 3)),
+    ])
+
+class TraceRecorder:
+    '''Appends one record per step to chunk files, written by a background thread in blocks'''
+    def __init__(self, path, track_name, reward_module_name, bots_count, block_steps=BLOCK_STEPS, chunk_steps=CHUNK_STEPS):
+        if os.path.exists(os.path.join(path, META_FILE)):
+            raise FileExistsError("{} already holds a trace".format(path))
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.dtype = get_step_dtype(bots_count)
+        self.block_steps = block_steps
+        self.chunk_steps = chunk_steps
+
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump({
+                "version": TRACE_VERSION,
+                "track": track_name,
+                "reward_module": reward_module_name,
+                "bots_count": bots_count,
+                "chunk_steps": chunk_steps,
+                "dtype": np.lib.format.dtype_to_descr(self.dtype),
+            }, f, indent=2)
+
+        self.block = np.zeros(block_steps, self.dtype)
+        self.count = 0  # steps recorded
+        self.filled = 0  # steps in the current block
+        self.written = 0  # steps written by the writer thread
+        self.error = None
+
+        self.queue = queue.Queue(QUEUE_BLOCKS)
+        self.thread = threading.Thread(target=self.write_blocks, daemon=True)
+        self.thread.start()
+
+    def record(self, sim, result):
+        '''Add a step of the simulation to the trace'''
+        params = result.params
+        max_reward = result.max_reward
+
+        if max_reward is not None:
+            speed, steering_angle, reward = max_reward["speed"], max_reward["angle"], max_reward["reward"]
+        else:
+            speed = steering_angle = reward = np.nan
+
+        bots = np.column_stack([sim.bots.pos, sim.bots.heading])
+
+        self.block[self.filled] = (
+            self.count, params["x"], params["y"], params["heading"], result.closest_idx, params["progress"],
+            speed, steering_angle, reward, result.offtrack, result.crashed, result.warned, result.lap_completed, bots)
+
+        self.count += 1
+        self.filled += 1
+        if self.filled == self.block_steps:
+            self.flush()
+
+    def flush(self):
+        '''Hand the steps recorded so far to the writer thread'''
+        if self.error is not None:
+            raise self.error
+        if self.filled > 0:
+            self.queue.put(self.block[:self.filled])
+            self.block = np.zeros(self.block_steps, self.dtype)
+            self.filled = 0
+
+    def write_blocks(self):
+        '''Append the blocks to the chunk files until close, on the writer thread'''
+        f = None
+        chunk = -1
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if self.error is not None:
+                continue
+
+            try:
+                while len(block) > 0:
+                    if self.written // self.chunk_steps != chunk:
+                        if f is not None:
+                            f.close()
+                        chunk = self.written // self.chunk_steps
+                        f = open(os.path.join(self.path, CHUNK_FILE.format(chunk)), "ab")
+
+                    room = self.chunk_steps - self.written % self.chunk_steps
+                    f.write(block[:room].tobytes())
+                    self.written += len(block[:room])
+                    block = block[room:]
+                f.flush()
+            except Exception as ex:
+                self.error = ex
+
+        if f is not None:
+            f.close()
+
+    def close(self):
+        '''Write the last steps and wait for the writer thread'''
+        if self.thread is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class TraceReader:
+    '''Reads a trace as memory-mapped record arrays, one per chunk file'''
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != TRACE_VERSION:
+            raise ValueError("Unsupported trace version {} in {}".format(self.meta["version"], path))
+
+        self.path = path
+        # json turns the tuples of the descr, and the shapes in them, into lists
+        descr = [tuple(tuple(value) if isinstance(value, list) else value for value in field) for field in self.meta["dtype"]]
+        self.dtype = np.lib.format.descr_to_dtype(descr)
+        self.chunk_steps = self.meta["chunk_steps"]
+
+        self.chunks = []
+        for chunk_path in sorted(glob.glob(os.path.join(path, CHUNK_FILE.replace("{:06d}", "*")))):
+            # a step cut short by a crash is left out
+            steps = os.path.getsize(chunk_path) // self.dtype.itemsize
+            if steps > 0:
+                self.chunks.append(np.memmap(chunk_path, self.dtype, "r", shape=(steps,)))
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        chunk, offset = divmod(index, self.chunk_steps)
+        if index < 0 or chunk >= len(self.chunks) or offset >= len(self.chunks[chunk]):
+            raise IndexError("step {} out of range".format(index))
+        return self.chunks[chunk][offset]
+
+    def get_range(self, start, end):
+        '''Get the steps from start up to end, copied into a single array'''
+        start, end = max(start, 0), min(end, len(self))
+        parts = []
+        for chunk in range(start // self.chunk_steps, (end - 1) // self.chunk_steps + 1):
+            offset = chunk * self.chunk_steps
+            parts.append(self.chunks[chunk][max(start - offset, 0):end - offset])
+        if len(parts) == 0 or end <= start:
+            return np.empty(0, self.dtype)
+        return np.concatenate(parts)
+
+    def get_column(self, name):
+        '''Get one field of every step, copied into a single array'''
+        if len(self.chunks) == 0:
+            return np.empty(0, self.dtype[name])
+        return np.concatenate([chunk[name] for chunk in self.chunks])
+
+def parse_args():
+    params = argparse.ArgumentParser(description=TITLE)
+    params.add_argument("path", help="trace directory")
+    return params.parse_args()
+
+def run():
+    '''Print the summary of a recorded trace'''
+    args = parse_args()
+
+    trace = TraceReader(args.path)
+    meta = trace.meta
+
+    print("track", meta["track"], "reward", meta["reward_module"], "bots", meta["bots_count"])
+    print("steps", len(trace), "in", len(trace.chunks), "chunks of", trace.dtype.itemsize, "bytes per step")
+
+    if len(trace) > 0:
+        reward = trace.get_column("reward")
+        print("laps", int(trace.get_column("lap_completed").sum()))
+        print("offtrack", int(trace.get_column("offtrack").sum()))
+        print("total_reward {:3f}".format(float(np.nansum(reward))))
+
+if __name__ == "__main__":
+    run()
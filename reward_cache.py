@@ -0,0 +1,107 @@
+import hashlib
+import inspect
+import os
+import pickle
+from collections import OrderedDict
+
+from reward_pool import calculate_reward
+
+# Constants
+CACHE_DIR = "./cache/rewards/"
+CACHE_SIZE = 100000  # rewards kept, the least recently used go first
+CACHE_KEYS = "REWARD_CACHE_KEYS"  # module attribute declaring the params keys and their quantization steps
+
+def quantize(value, step):
+    '''Get value as a count of steps, exact when step is None'''
+    if isinstance(value, (list, tuple)):
+        return tuple(quantize(v, step) for v in value)
+    if step is None or isinstance(value, bool):
+        return value
+    return round(value / step)
+
+def get_module_hash(reward_module):
+    '''Get the hash of the source of a reward module and of its cache keys'''
+    digest = hashlib.sha1(inspect.getsource(reward_module).encode())
+    digest.update(repr(sorted(getattr(reward_module, CACHE_KEYS).items())).encode())
+    return digest.hexdigest()[:16]
+
+def get_cache_path(reward_module, track_name):
+    name = reward_module.__name__.split(".")[-1]
+    return CACHE_DIR + "{}-{}-{}.pkl".format(name, get_module_hash(reward_module), track_name)
+
+class RewardCache:
+    '''Memoizes the rewards of a module on a few params keys, quantized, in a bounded LRU
+
+    The keys and their quantization steps come from the REWARD_CACHE_KEYS dict of
+    the module, e.g. {"distance_from_center": 0.01, "closest_waypoints": None}, and
+    speed and steering_angle are always part of the key. Every state that lands in
+    the same steps gets the reward of the first one.
+    '''
+    def __init__(self, reward_module, keys, size=CACHE_SIZE, path=None):
+        self.reward_module = reward_module
+        self.keys = sorted(keys.items())
+        self.size = size
+        self.path = path
+
+        self.rewards = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None and os.path.isfile(path):
+            with open(path, "rb") as f:
+                self.rewards.update(pickle.load(f)[-size:])
+
+    def get_key(self, params, speed, steering_angle):
+        return tuple(quantize(params[key], step) for key, step in self.keys) + (speed, steering_angle)
+
+    def calculate_reward(self, params, speed, steering_angle):
+        '''Same as calculate_reward, from the cache when a close enough state was seen'''
+        key = self.get_key(params, speed, steering_angle)
+
+        reward = self.rewards.get(key)
+        if reward is not None:
+            self.hits += 1
+            self.rewards.move_to_end(key)
+        else:
+            self.misses += 1
+            reward = calculate_reward(self.reward_module, params, speed, steering_angle)["reward"]
+            self.rewards[key] = reward
+            if len(self.rewards) > self.size:
+                self.rewards.popitem(last=False)
+                self.evictions += 1
+
+        return {"reward": reward, "angle": steering_angle, "speed": speed}
+
+    def get_stats(self):
+        calls = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.rewards),
+            "hit_rate": self.hits / calls if calls > 0 else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print("reward_cache hits {} misses {} evictions {} size {} hit_rate {:.1%}".format(
+            stats["hits"], stats["misses"], stats["evictions"], stats["size"], stats["hit_rate"]))
+
+    def save(self):
+        '''Write the rewards to the cache file, when the cache has one'''
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = "{}.tmp-{}".format(self.path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(list(self.rewards.items()), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+def get_reward_cache(reward_module, track_name, size=CACHE_SIZE, persist=False):
+    '''Get a cache for a module declaring REWARD_CACHE_KEYS, None for the others'''
+    keys = getattr(reward_module, CACHE_KEYS, None)
+    if not keys:
+        return None
+    path = get_cache_path(reward_module, track_name) if persist else None
+    return RewardCache(reward_module, keys, size, path)
@@ -0,0 +1,149 @@
+import importlib
+import os
+import numpy as np
+
+# Constants
+BACKENDS = ["inline", "thread", "process"]
+DEFAULT_BACKEND = "inline"
+
+def calculate_reward(reward_module, params, speed, steering_angle):
+    '''Calculate reward for a given speed and steering angle'''
+    # params only holds frozen values, so a shallow copy is enough to keep the simulator safe
+    params_copy = dict(params, speed=speed, steering_angle=steering_angle)
+    reward = reward_module.reward_function(params_copy)
+    return {"reward": reward, "angle": steering_angle, "speed": speed}
+
+def evaluate_actions(reward_module, params, speeds, steering_angles, cache=None):
+    '''Get the reward grid with one row per speed and one column per steering angle
+
+    A reward module can provide reward_function_batch(params, speeds, angles) taking
+    both as NumPy arrays and returning the whole grid at once, otherwise
+    reward_function is called for every action. With a cache every action goes
+    through it instead.
+    '''
+    speeds = np.asarray(speeds, dtype=float)
+    steering_angles = np.asarray(steering_angles, dtype=float)
+    shape = (len(speeds), len(steering_angles))
+
+    if cache is not None:
+        rewards = np.empty(shape)
+        for i, speed in enumerate(speeds.tolist()):
+            for j, steering_angle in enumerate(steering_angles.tolist()):
+                rewards[i, j] = cache.calculate_reward(params, speed, steering_angle)["reward"]
+        return rewards
+
+    reward_function_batch = getattr(reward_module, "reward_function_batch", None)
+    if reward_function_batch is not None:
+        rewards = reward_function_batch(dict(params), speeds, steering_angles)
+        return np.broadcast_to(np.asarray(rewards, dtype=float), shape)
+
+    rewards = np.empty(shape)
+    for i, speed in enumerate(speeds.tolist()):
+        for j, steering_angle in enumerate(steering_angles.tolist()):
+            rewards[i, j] = calculate_reward(reward_module, params, speed, steering_angle)["reward"]
+    return rewards
+
+def find_max_reward(rewards, speeds, steering_angles):
+    '''Find the max reward in a reward grid'''
+    i, j = np.unravel_index(np.argmax(rewards), rewards.shape)
+    return {"reward": float(rewards[i, j]), "angle": steering_angles[j], "speed": speeds[i]}
+
+# State of a process worker, set once by init_worker
+g_worker_module = None
+g_worker_static = None
+
+def init_worker(module_name, static_params):
+    '''Load the reward module and the track data once per process worker'''
+    global g_worker_module
+    global g_worker_static
+
+    g_worker_module = importlib.import_module(module_name)
+    g_worker_static = static_params
+
+def evaluate_chunk(step_params, actions):
+    '''Evaluate a chunk of (speed, steering_angle) actions in a process worker'''
+    params = dict(g_worker_static, **step_params)
+    return [calculate_reward(g_worker_module, params, speed, steering_angle)["reward"] for speed, steering_angle in actions]
+
+def split_chunks(items, count):
+    '''Split items into count chunks of about the same size'''
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            chunks.append(items[start:end])
+        start = end
+    return chunks
+
+class RewardPool:
+    '''Evaluates the action space of every step with workers that live for the whole run
+
+    Modules with reward_function_batch are always evaluated inline, as one vectorized call
+    beats handing the actions out to workers, and so is a cached module, as the
+    cache lives in this process. The process backend costs a round trip to every
+    worker per step, it only pays off when the reward function is expensive.
+    '''
+    def __init__(self, reward_module, static_params, backend=DEFAULT_BACKEND, workers=None, cache=None):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend {}, expected one of {}".format(backend, BACKENDS))
+
+        self.reward_module = reward_module
+        self.static_params = static_params
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self.executor = None
+
+        if hasattr(reward_module, "reward_function_batch") or cache is not None:
+            backend = "inline"
+        self.backend = backend
+
+        if backend != "inline":
+            # only the pools need it, and it pulls in logging
+            import concurrent.futures
+
+        if backend == "thread":
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        elif backend == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers,
+                initializer=init_worker,
+                initargs=(reward_module.__name__, static_params),
+            )
+
+    def evaluate(self, params, speeds, steering_angles):
+        '''Get the reward grid with one row per speed and one column per steering angle'''
+        if self.executor is None:
+            return evaluate_actions(self.reward_module, params, speeds, steering_angles, self.cache)
+
+        actions = [(speed, steering_angle) for speed in speeds for steering_angle in steering_angles]
+        chunks = split_chunks(actions, self.workers)
+
+        if self.backend == "process":
+            # Only the per step state crosses the process boundary
+            step_params = {key: value for key, value in params.items() if key not in self.static_params}
+            tasks = [self.executor.submit(evaluate_chunk, step_params, chunk) for chunk in chunks]
+        else:
+            tasks = [self.executor.submit(self.evaluate_thread_chunk, params, chunk) for chunk in chunks]
+
+        rewards = []
+        for task in tasks:
+            rewards += task.result()
+
+        return np.array(rewards, dtype=float).reshape(len(speeds), len(steering_angles))
+
+    def evaluate_thread_chunk(self, params, actions):
+        return [calculate_reward(self.reward_module, params, speed, steering_angle)["reward"] for speed, steering_angle in actions]
+
+    def close(self):
+        '''Shut the workers down'''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
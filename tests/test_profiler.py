@@ -0,0 +1,15 @@
+import numpy as np
+
+from profiler import HISTOGRAM_BINS, format_seconds, get_histogram
+
+def test_histogram_counts_every_call():
+    latencies = np.array([0, 1e-9, 5e-8, 1e-7, 3e-6, 2e-3, 0.5, 1, 2.5, 60])
+    histogram = get_histogram(latencies)
+    assert len(histogram) == len(HISTOGRAM_BINS) - 1
+    assert histogram.sum() == len(latencies)
+    assert histogram[0] == 3  # under 100ns
+    assert histogram[-1] == 3  # 1s and over
+
+def test_format_seconds_open_bins():
+    assert format_seconds(0) == "0ns"
+    assert format_seconds(HISTOGRAM_BINS[-1]) == "inf"
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+
+# Constants
+FRAME_BUDGET = 1 / 15  # seconds, DeepRacer runs the function at 15 fps
+MAX_EVENTS = 1000000  # trace events kept, the summary keeps counting after that
+
+class NullSpan:
+    '''Does nothing, so a disabled span only costs the with statement'''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class NullTracer:
+    '''Tracer used when tracing is off'''
+    enabled = False
+
+    def span(self, name):
+        return NULL_SPAN
+
+    def end_frame(self):
+        pass
+
+NULL_TRACER = NullTracer()
+
+class Span:
+    '''Times one phase and hands it to the tracer when it ends'''
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.add(self.name, self.start, time.perf_counter_ns())
+        return False
+
+class Tracer:
+    '''Records named spans of the step loop for a Chrome trace and a per phase summary'''
+    enabled = True
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.totals = {}
+        self.frame = {}
+        self.last_frame = {}
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+    def span(self, name):
+        return Span(self, name)
+
+    def add(self, name, start, end):
+        duration = end - start
+
+        if len(self.events) < MAX_EVENTS:
+            self.events.append({
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self.origin) / 1000,
+                "dur": duration / 1000,
+                "pid": self.pid,
+                "tid": self.tid,
+            })
+
+        count, total, longest = self.totals.get(name, (0, 0, 0))
+        self.totals[name] = (count + 1, total + duration, max(longest, duration))
+
+        self.frame[name] = self.frame.get(name, 0) + duration
+
+    def end_frame(self):
+        '''Keep the durations of the frame that just ended, for the HUD'''
+        self.last_frame = self.frame
+        self.frame = {}
+
+    def get_frame_usage(self, name):
+        '''Get the share of the frame budget a phase used in the last frame'''
+        return self.last_frame.get(name, 0) / 1e9 / FRAME_BUDGET
+
+    def save(self, path):
+        '''Write the spans as Chrome trace events, for chrome://tracing or Perfetto'''
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def print_summary(self):
+        '''Print the time spent in each phase, the slowest first'''
+        print("{:<28} {:>8} {:>12} {:>10} {:>10}".format("phase", "count", "total ms", "mean ms", "max ms"))
+        for name, (count, total, longest) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            print("{:<28} {:>8} {:>12.1f} {:>10.3f} {:>10.3f}".format(name, count, total / 1e6, total / count / 1e6, longest / 1e6))
+
+def get_tracer(enabled):
+    return Tracer() if enabled else NULL_TRACER
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import glob
+import hashlib
+import os
+import shutil
+import numpy as np
+
+# Constants
+TITLE = "DeepRacer Track Cache"
+ROUTES_DIR = "./routes/"
+CACHE_DIR = "./cache/tracks/"
+CACHE_VERSION = 2  # bump when the compiled arrays change
+QUAD_CELL = 0.25  # meters, cell size of the grid of track quads
+
+def get_route_path(route):
+    return ROUTES_DIR + route + ".npy"
+
+def get_route_names():
+    '''Get the names of every route'''
+    return sorted(os.path.basename(path)[:-4] for path in glob.glob(ROUTES_DIR + "*.npy"))
+
+def get_route_hash(route):
+    '''Get the hash of the route file and of the cache format'''
+    with open(get_route_path(route), "rb") as f:
+        digest = hashlib.sha1(f.read())
+    digest.update(str(CACHE_VERSION).encode())
+    return digest.hexdigest()[:16]
+
+def get_cache_path(route):
+    return CACHE_DIR + route + "-" + get_route_hash(route)
+
+def get_point_curvature(prev_points, points, next_points):
+    '''Get the signed curvature at each point, from the circle through it and its neighbours'''
+    a = np.hypot(*(points - prev_points).T)
+    b = np.hypot(*(next_points - points).T)
+    c = np.hypot(*(next_points - prev_points).T)
+
+    cross = (
+        (points[:, 0] - prev_points[:, 0]) * (next_points[:, 1] - points[:, 1]) -
+        (points[:, 1] - prev_points[:, 1]) * (next_points[:, 0] - points[:, 0]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        curvature = 2 * cross / (a * b * c)
+    return np.where(np.isfinite(curvature), curvature, 0)
+
+def get_curvature(points):
+    '''Get the signed curvature at each point of a closed line'''
+    return get_point_curvature(np.roll(points, 1, axis=0), points, np.roll(points, -1, axis=0))
+
+def get_quads(inside, outside):
+    '''Get the quad of track between each waypoint and the next, as 4 corners in order'''
+    return np.stack([inside, np.roll(inside, -1, axis=0), np.roll(outside, -1, axis=0), outside], axis=1)
+
+def get_quad_grid(quads, cell_size=QUAD_CELL):
+    '''Get a uniform grid listing the quads whose bounding box touches each cell
+
+    Returns the grid origin, cell size and size, the start of the quads of each
+    cell in the quad ids, row by row, and the quad ids.
+    '''
+    low = quads.min(axis=1)
+    high = quads.max(axis=1)
+    origin = low.min(axis=0)
+
+    first = np.floor((low - origin) / cell_size).astype(np.int64)
+    last = np.floor((high - origin) / cell_size).astype(np.int64)
+    cols, rows = last.max(axis=0) + 1
+
+    cell_ids = []
+    quad_ids = []
+    for quad, ((x0, y0), (x1, y1)) in enumerate(zip(first.tolist(), last.tolist())):
+        cells_x, cells_y = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        cell_ids.append((cells_y * cols + cells_x).ravel())
+        quad_ids.append(np.full(cells_x.size, quad))
+
+    cell_ids = np.concatenate(cell_ids)
+    quad_ids = np.concatenate(quad_ids)
+    order = np.argsort(cell_ids, kind="stable")
+
+    starts = np.searchsorted(cell_ids[order], np.arange(cols * rows + 1))
+    grid = np.array([origin[0], origin[1], cell_size, cols, rows], dtype=float)
+    return grid, starts, quad_ids[order]
+
+def compile_track(route):
+    '''Compute every derived array of a route'''
+    loaded_route = np.load(get_route_path(route))
+
+    center = np.ascontiguousarray(loaded_route[:, 0:2], dtype=float)
+    inside = np.ascontiguousarray(loaded_route[:, 2:4], dtype=float)
+    outside = np.ascontiguousarray(loaded_route[:, 4:6], dtype=float)
+
+    segments = np.roll(center, -1, axis=0) - center
+    segment_lengths = np.hypot(*segments.T)
+
+    quads = get_quads(inside, outside)
+    quad_grid, quad_starts, quad_ids = get_quad_grid(quads)
+
+    return {
+        "center": center,
+        "inside": inside,
+        "outside": outside,
+        "segments": segments,
+        "segment_lengths": segment_lengths,
+        "headings": np.degrees(np.arctan2(segments[:, 1], segments[:, 0])),
+        "widths": np.hypot(*(inside - outside).T),
+        "arc_lengths": np.concatenate([[0], np.cumsum(segment_lengths)]),
+        "curvatures": get_curvature(center),
+        # the screen is fit to the outside border
+        "bounds": np.array([outside[:, 0].min(), outside[:, 1].min(), outside[:, 0].max(), outside[:, 1].max()]),
+        "left": (center + inside) * 0.5,
+        "right": (center + outside) * 0.5,
+        "left2": center + (inside - center) * 0.9,
+        "right2": center + (outside - center) * 0.9,
+        "wall_starts": np.concatenate([inside, outside]),
+        "wall_ends": np.concatenate([np.roll(inside, -1, axis=0), np.roll(outside, -1, axis=0)]),
+        "quads": quads,
+        "quad_grid": quad_grid,
+        "quad_starts": quad_starts,
+        "quad_ids": quad_ids,
+    }
+
+def save_arrays(path, arrays, force=False):
+    '''Save named arrays as the npy files of a cache directory at once, and get its path
+
+    An existing directory is only replaced with force, as other processes may have
+    its files mapped, otherwise it is kept and the new arrays are dropped.
+    '''
+    tmp_path = "{}.tmp-{}".format(path, os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), array)
+
+    if os.path.isdir(path):
+        if not force:
+            # Built by another process in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return path
+        shutil.rmtree(path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Built by another process in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return path
+
+def build_cache(route, force=False):
+    '''Compile a route into the cache unless it is already there, and get its path'''
+    path = get_cache_path(route)
+    if os.path.isdir(path) and not force:
+        return path
+    return save_arrays(path, compile_track(route), force)
+
+def load_track_geometry(route):
+    '''Get the compiled arrays of a route as memory-mapped arrays, compiling it when needed'''
+    path = build_cache(route)
+    geometry = {}
+    for file in os.listdir(path):
+        if file.endswith(".npy"):
+            geometry[file[:-4]] = np.load(os.path.join(path, file), mmap_mode="r")
+    return geometry
+
+def get_route_params(title):
+    '''Get the arguments shared by the commands building something for every route'''
+    params = argparse.ArgumentParser(description=title)
+    params.add_argument("routes", nargs="*", help="route names, all routes when empty")
+    params.add_argument("--workers", type=int, default=None, help="processes count")
+    params.add_argument("--force", default=False, action="store_true", help="rebuild what is already in the cache")
+    return params
+
+def build_routes(build, routes, workers=None):
+    '''Call build with each route in a process pool, and yield each route and its result as they complete'''
+    # not at the top, track_loader imports this module on every start
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        tasks = {executor.submit(build, route): route for route in routes}
+        for task in concurrent.futures.as_completed(tasks):
+            yield tasks[task], task.result()
+
+def parse_args():
+    return get_route_params(TITLE).parse_args()
+
+def run():
+    '''Build the cache of every route in parallel'''
+    args = parse_args()
+
+    routes = args.routes or get_route_names()
+
+    for route, path in build_routes(functools.partial(build_cache, force=args.force), routes, args.workers):
+        print(route, path)
+
+    print("built", len(routes), "routes in", CACHE_DIR)
+
+if __name__ == "__main__":
+    run()
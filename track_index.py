@@ -0,0 +1,69 @@
+import numpy as np
+
+from collision import expand_ranges
+
+# Constants
+WHEELBASE = 0.165  # meters, between the front and the rear axles of the 1/18 scale car
+WHEEL_TRACK = 0.16  # meters, between the left and the right wheels
+WHEELS = [(1, 1), (1, -1), (-1, -1), (-1, 1)]  # front left, front right, rear right, rear left
+
+def get_wheels(pos, heading, length=WHEELBASE, width=WHEEL_TRACK):
+    '''Get the positions of the 4 wheels of each car, around its position'''
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    rad = np.radians(np.asarray(heading, dtype=float).reshape(-1))
+    forward = np.stack([np.cos(rad), np.sin(rad)], axis=1)[:, None, :]
+    left = np.stack([-np.sin(rad), np.cos(rad)], axis=1)[:, None, :]
+
+    sides = np.array(WHEELS, dtype=float)
+    return pos[:, None, :] + sides[None, :, 0, None] * forward * (length / 2) + sides[None, :, 1, None] * left * (width / 2)
+
+class TrackIndex:
+    '''Tells whether points are on the track, from the quads between consecutive waypoints
+
+    The quads come from the track cache with a uniform grid listing the quads near
+    each cell, so a point is only tested against the few quads of its cell.
+    '''
+    def __init__(self, geometry):
+        self.quads = np.asarray(geometry["quads"])
+        x, y, self.cell_size, cols, rows = np.asarray(geometry["quad_grid"]).tolist()
+        self.origin = np.array([x, y])
+        self.cols, self.rows = int(cols), int(rows)
+        self.starts = np.asarray(geometry["quad_starts"])
+        self.quad_ids = np.asarray(geometry["quad_ids"])
+
+        # the start y, end y, start x and x step per y step of each edge of each quad, packed to gather them at once
+        ends = np.roll(self.quads, -1, axis=1)
+        dy = ends[:, :, 1] - self.quads[:, :, 1]
+        slopes = (ends[:, :, 0] - self.quads[:, :, 0]) / np.where(dy == 0, 1, dy)
+        self.edges = np.ascontiguousarray(np.stack([self.quads[:, :, 1], ends[:, :, 1], self.quads[:, :, 0], slopes], axis=0))
+
+    def contains(self, points):
+        '''Get whether each point is inside at least one quad of the track'''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        in_grid = (cells[:, 0] >= 0) & (cells[:, 0] < self.cols) & (cells[:, 1] >= 0) & (cells[:, 1] < self.rows)
+        cell_ids = np.where(in_grid, cells[:, 1] * self.cols + cells[:, 0], 0)
+
+        starts = np.where(in_grid, self.starts[cell_ids], 0)
+        ends = np.where(in_grid, self.starts[cell_ids + 1], 0)
+        owners, items = expand_ranges(starts, ends)
+
+        # crossing number of each point with the 4 edges of each of its quads
+        ay, by, ax, slopes = np.take(self.edges, self.quad_ids[items], axis=1)
+        px = points[owners, 0, None]
+        py = points[owners, 1, None]
+        crosses = (ay > py) != (by > py)
+        x = ax + (py - ay) * slopes
+        inside = (crosses & (px < x)).sum(axis=1) % 2 == 1
+
+        return np.bincount(owners[inside], minlength=len(points)) > 0
+
+    def wheels_inside(self, pos, heading):
+        '''Get whether each of the 4 wheels of each car is on the track, one row per car'''
+        wheels = get_wheels(pos, heading)
+        return self.contains(wheels.reshape(-1, 2)).reshape(-1, len(WHEELS))
+
+    def wheels_on_track(self, pos, heading):
+        '''Get whether all 4 wheels of each car are on the track'''
+        return self.wheels_inside(pos, heading).all(axis=1)
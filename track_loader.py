@@ -1,6 +1,8 @@
 import os
 import numpy as np
 
+from track_cache import load_track_geometry
+
 class Track_Loader:
   def __init__(self, route):
     self.route = route
@@ -11,11 +13,8 @@ class Track_Loader:
     self.inside_waypoints = [[r[2], r[3]] for r in loaded_route]
     self.outside_waypoints = [[r[4], r[5]] for r in loaded_route]
 
-    racing_line_path = "./racinglines/" + route + ".npy"
-    self.racing_line = []
-
-    if (os.path.isfile(racing_line_path)):
-        self.racing_line = np.load(racing_line_path)
+    self.racing_line = None
+    self.geometry = None
 
   def get_center_waypoints(self):
       return self.center_waypoints
@@ -27,4 +26,19 @@ class Track_Loader:
       return self.outside_waypoints
 
   def get_shortcut_waypoints(self):
-      return self.racing_line
\ No newline at end of file
+      '''Get the racing line stored in racinglines, or the one generated for the route, see racing_line'''
+      if self.racing_line is None:
+          racing_line_path = "./racinglines/" + self.route + ".npy"
+          if (os.path.isfile(racing_line_path)):
+              self.racing_line = np.load(racing_line_path)
+          else:
+              # not at the top, the racing line is only generated when it is drawn
+              from racing_line import load_racing_track
+              self.racing_line = load_racing_track(self.route)[:, :2]
+      return self.racing_line
+
+  def get_geometry(self):
+      '''Get the compiled arrays of the track, see track_cache'''
+      if self.geometry is None:
+          self.geometry = load_track_geometry(self.route)
+      return self.geometry
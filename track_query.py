@@ -0,0 +1,271 @@
+import math
+import numpy as np
+
+# Constants
+CELL_RATE = 4  # cell size in average waypoint spacings
+WINDOW = 5  # waypoints searched on each side of the previous closest one
+
+class TrackQuery:
+    '''Answers closest waypoint queries with a uniform grid and a search window
+
+    Without a previous index the grid is searched ring by ring around the position.
+    With one, only a window around it is searched, and moved along the waypoints
+    until the closest waypoint is inside it, so the index never snaps across a hairpin.
+    '''
+    def __init__(self, waypoints, window=WINDOW):
+        self.waypoints = [(p[0], p[1]) for p in waypoints]
+        self.window = window
+
+        length = len(self.waypoints)
+        spacing = sum(
+            math.hypot(
+                self.waypoints[i][0] - self.waypoints[(i + 1) % length][0],
+                self.waypoints[i][1] - self.waypoints[(i + 1) % length][1],
+            )
+            for i in range(length)
+        ) / max(length, 1)
+        self.cell_size = max(spacing * CELL_RATE, 1e-6)
+
+        self.grid = {}
+        for i, p in enumerate(self.waypoints):
+            self.grid.setdefault(self.get_cell(p), []).append(i)
+
+        cells = list(self.grid.keys()) or [(0, 0)]
+        self.min_cell = (min(c[0] for c in cells), min(c[1] for c in cells))
+        self.max_cell = (max(c[0] for c in cells), max(c[1] for c in cells))
+
+    def get_cell(self, pos):
+        return (int(math.floor(pos[0] / self.cell_size)), int(math.floor(pos[1] / self.cell_size)))
+
+    def closest(self, pos, prev_idx=None):
+        '''Get the distance to and the index of the closest waypoint'''
+        if prev_idx is None:
+            return self.closest_global(pos)
+        return self.closest_near(pos, prev_idx)
+
+    def closest_global(self, pos):
+        '''Search the grid ring by ring until no closer waypoint can exist'''
+        x, y = pos[0], pos[1]
+        cx, cy = self.get_cell(pos)
+        min_dist = float("inf")
+        min_idx = -1
+
+        # No waypoint is further away than this
+        max_ring = max(
+            cx - self.min_cell[0],
+            self.max_cell[0] - cx,
+            cy - self.min_cell[1],
+            self.max_cell[1] - cy,
+        )
+
+        for ring in range(0, max_ring + 1):
+            for cell in ring_cells(cx, cy, ring):
+                for i in self.grid.get(cell, ()):
+                    p = self.waypoints[i]
+                    dist = math.hypot(x - p[0], y - p[1])
+                    if dist < min_dist or (dist == min_dist and i < min_idx):
+                        min_dist = dist
+                        min_idx = i
+
+            # Every waypoint in the next ring is at least this far away
+            if min_dist <= ring * self.cell_size:
+                break
+
+        return min_dist, min_idx
+
+    def closest_near(self, pos, prev_idx):
+        '''Search a window around the previous index, moving it until it holds the closest waypoint'''
+        x, y = pos[0], pos[1]
+        waypoints = self.waypoints
+        length = len(waypoints)
+        window = min(self.window, length // 2)
+
+        center = prev_idx % length
+        for _ in range(0, length):
+            min_dist = float("inf")
+            min_idx = -1
+            min_offset = 0
+            for offset in range(-window, window + 1):
+                i = (center + offset) % length
+                p = waypoints[i]
+                dist = math.hypot(x - p[0], y - p[1])
+                # Same as a full scan on ties, e.g. when the last waypoint closes the loop
+                if dist < min_dist or (dist == min_dist and i < min_idx):
+                    min_dist = dist
+                    min_idx = i
+                    min_offset = offset
+
+            center = min_idx
+            if abs(min_offset) < window:
+                break
+
+        return min_dist, center
+
+def ring_cells(cx, cy, ring):
+    '''Get the grid cells at exactly ring cells from the given one'''
+    if ring == 0:
+        return [(cx, cy)]
+
+    cells = []
+    for i in range(-ring, ring + 1):
+        cells.append((cx + i, cy - ring))
+        cells.append((cx + i, cy + ring))
+    for i in range(-ring + 1, ring):
+        cells.append((cx - ring, cy + i))
+        cells.append((cx + ring, cy + i))
+    return cells
+
+def closest_batch(waypoints, pos, prev_idx=None, window=WINDOW):
+    '''Get the distances to and the indexes of the closest waypoints of many positions at once
+
+    The waypoints are either one line shared by every position or one line per
+    position. Without previous indexes every waypoint is searched, otherwise a
+    window around them, moved like in TrackQuery.closest_near. Ties go to the
+    lowest index, like a full scan.
+    '''
+    waypoints = np.asarray(waypoints, dtype=float)
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    length = waypoints.shape[-2]
+    rows = np.arange(len(pos))
+
+    def get_points(moving, idx):
+        if waypoints.ndim == 2:
+            return waypoints[idx]
+        return waypoints[moving[:, None], idx]
+
+    if prev_idx is None:
+        idx = np.broadcast_to(np.arange(length), (len(pos), length))
+        points = get_points(rows, idx)
+        dists = np.hypot(points[:, :, 0] - pos[:, None, 0], points[:, :, 1] - pos[:, None, 1])
+        closest_idx = np.argmin(dists, axis=1)
+        return dists[rows, closest_idx], closest_idx
+
+    window = min(window, length // 2)
+    offsets = np.arange(-window, window + 1)
+    closest_idx = np.array(prev_idx, dtype=int) % length
+    closest_dist = np.empty(len(pos))
+    moving = rows
+
+    for _ in range(length):
+        idx = (closest_idx[moving, None] + offsets) % length
+        points = get_points(moving, idx)
+        dists = np.hypot(points[:, :, 0] - pos[moving, None, 0], points[:, :, 1] - pos[moving, None, 1])
+
+        min_dist = dists.min(axis=1)
+        is_min = dists == min_dist[:, None]
+        min_idx = np.where(is_min, idx, length).min(axis=1)
+        min_offset = offsets[np.argmax(is_min & (idx == min_idx[:, None]), axis=1)]
+
+        closest_idx[moving] = min_idx
+        closest_dist[moving] = min_dist
+        moving = moving[np.abs(min_offset) >= window]
+        if len(moving) == 0:
+            break
+
+    return closest_dist, closest_idx
+
+class TrackProjection:
+    '''Projects positions onto the segments of the center line, for continuous progress and offsets
+
+    Uses the segments and cumulative arc lengths of the track cache. Without previous
+    segments every segment is searched, otherwise a window around them, moved along
+    the track until the closest segment is inside it, so each step costs the same.
+    '''
+    def __init__(self, geometry, window=WINDOW):
+        self.starts = np.asarray(geometry["center"], dtype=float)
+        self.segments = np.asarray(geometry["segments"], dtype=float)
+        self.lengths = np.asarray(geometry["segment_lengths"], dtype=float)
+        self.arc_lengths = np.asarray(geometry["arc_lengths"], dtype=float)
+        self.total_length = float(self.arc_lengths[-1])
+        self.window = min(window, len(self.starts) // 2)
+
+        # the closing segment is empty on most routes
+        lengths2 = self.lengths ** 2
+        self.inv_lengths2 = np.divide(1, lengths2, out=np.zeros_like(lengths2), where=lengths2 > 0)
+
+        # for project_one, plain floats are faster than arrays for a single position
+        self.segment_list = np.column_stack([self.starts, self.segments, self.inv_lengths2]).tolist()
+
+    def project_on(self, pos, idx):
+        '''Get the distance to, the fraction along and the side of the segments idx of each position'''
+        starts = self.starts[idx]
+        segments = self.segments[idx]
+        dx = pos[:, None, 0] - starts[:, :, 0]
+        dy = pos[:, None, 1] - starts[:, :, 1]
+
+        t = np.clip((dx * segments[:, :, 0] + dy * segments[:, :, 1]) * self.inv_lengths2[idx], 0, 1)
+        dists = np.hypot(dx - t * segments[:, :, 0], dy - t * segments[:, :, 1])
+        cross = segments[:, :, 0] * dy - segments[:, :, 1] * dx
+        return dists, t, cross
+
+    def project(self, pos, prev_idx=None):
+        '''Get the closest segment, the arc length along the center line and the signed offset of each position
+
+        The offset is the distance to the center line, positive on the left of the
+        direction of travel.
+        '''
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        length = len(self.starts)
+        rows = np.arange(len(pos))
+
+        if prev_idx is None:
+            idx = np.broadcast_to(np.arange(length), (len(pos), length))
+            dists, t, cross = self.project_on(pos, idx)
+            best = np.argmin(dists, axis=1)
+            segment_idx = best
+        else:
+            offsets = np.arange(-self.window, self.window + 1)
+            segment_idx = np.array(prev_idx, dtype=int).reshape(-1) % length
+            dists = np.empty((len(pos), len(offsets)))
+            t = np.empty_like(dists)
+            cross = np.empty_like(dists)
+            best = np.empty(len(pos), dtype=int)
+            moving = rows
+
+            for _ in range(length):
+                idx = (segment_idx[moving, None] + offsets) % length
+                dists[moving], t[moving], cross[moving] = self.project_on(pos[moving], idx)
+                best[moving] = np.argmin(dists[moving], axis=1)
+                segment_idx[moving] = idx[np.arange(len(moving)), best[moving]]
+
+                moving = moving[np.abs(offsets[best[moving]]) >= self.window]
+                if len(moving) == 0:
+                    break
+
+        arc_length = self.arc_lengths[segment_idx] + t[rows, best] * self.lengths[segment_idx]
+        offset = np.copysign(dists[rows, best], cross[rows, best])
+        return segment_idx, arc_length, offset
+
+    def project_one(self, pos, prev_idx=None):
+        '''Same as project for a single position, without arrays'''
+        if prev_idx is None:
+            segment_idx, arc_length, offset = self.project(pos)
+            return int(segment_idx[0]), float(arc_length[0]), float(offset[0])
+
+        x, y = pos[0], pos[1]
+        segments = self.segment_list
+        length = len(segments)
+
+        center = prev_idx % length
+        for _ in range(0, length):
+            min_dist = float("inf")
+            for offset in range(-self.window, self.window + 1):
+                i = (center + offset) % length
+                sx, sy, dx, dy, inv_length2 = segments[i]
+                px, py = x - sx, y - sy
+                t = min(max((px * dx + py * dy) * inv_length2, 0.0), 1.0)
+                dist = math.hypot(px - t * dx, py - t * dy)
+                if dist < min_dist:
+                    min_dist, min_idx, min_offset, min_t = dist, i, offset, t
+                    min_cross = dx * py - dy * px
+
+            center = min_idx
+            if abs(min_offset) < self.window:
+                break
+
+        arc_length = float(self.arc_lengths[center]) + min_t * float(self.lengths[center])
+        return center, arc_length, math.copysign(min_dist, min_cross)
+
+    def get_progress(self, arc_length):
+        '''Get the % of a lap at an arc length from the start'''
+        return arc_length / self.total_length * 100
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+import numpy as np
+
+from track_cache import build_routes, get_route_hash, get_route_names, get_route_params, load_track_geometry, save_arrays
+
+# Constants
+TITLE = "DeepRacer Track Raster"
+CACHE_DIR = "./cache/rasters/"
+RESOLUTION = 0.02  # meters per cell
+MARGIN = 1.0  # meters rasterized around the track
+FAR = 1e6  # meters, distance of the cells further than the margin
+FIELDS = ["waypoint", "waypoint_dist", "segment", "arc_length", "offset"]
+
+def get_cache_path(route, resolution=RESOLUTION):
+    return CACHE_DIR + "{}-{}-{}um".format(route, get_route_hash(route), int(round(resolution * 1e6)))
+
+def rasterize(geometry, resolution=RESOLUTION, margin=MARGIN):
+    '''Get the closest waypoint and the projection on the center line at the center of every cell
+
+    Each waypoint and segment only updates the cells within margin of it, so the
+    cells further from the track keep FAR, -1 and NaN.
+    '''
+    center = np.asarray(geometry["center"], dtype=float)
+    segments = np.asarray(geometry["segments"], dtype=float)
+    lengths = np.asarray(geometry["segment_lengths"], dtype=float)
+    arc_lengths = np.asarray(geometry["arc_lengths"], dtype=float)
+    bounds = np.asarray(geometry["bounds"], dtype=float)
+
+    origin = bounds[:2] - margin
+    cols, rows = (np.ceil((bounds[2:] + margin - origin) / resolution).astype(int) + 1).tolist()
+
+    waypoint = np.full((rows, cols), -1, dtype=np.int32)
+    waypoint_dist = np.full((rows, cols), FAR)
+    segment = np.full((rows, cols), -1, dtype=np.int32)
+    segment_dist = np.full((rows, cols), FAR)
+    arc_length = np.zeros((rows, cols))
+    offset = np.full((rows, cols), np.nan)
+
+    def get_cells(low, high):
+        '''Get the slices of the cells within margin of a box, and their centers'''
+        x0, y0 = np.maximum(np.floor((low - margin - origin) / resolution).astype(int), 0).tolist()
+        x1, y1 = np.minimum(np.ceil((high + margin - origin) / resolution).astype(int), [cols - 1, rows - 1]).tolist()
+        cells = (slice(y0, y1 + 1), slice(x0, x1 + 1))
+        xs = origin[0] + (np.arange(x0, x1 + 1) + 0.5) * resolution
+        ys = origin[1] + (np.arange(y0, y1 + 1) + 0.5) * resolution
+        return cells, xs[None, :], ys[:, None]
+
+    # Lowest index first, so ties go to it like in TrackQuery and TrackProjection
+    for i, p in enumerate(center):
+        cells, xs, ys = get_cells(p, p)
+        dist = np.hypot(xs - p[0], ys - p[1])
+        closer = dist < waypoint_dist[cells]
+        waypoint_dist[cells] = np.where(closer, dist, waypoint_dist[cells])
+        waypoint[cells] = np.where(closer, i, waypoint[cells])
+
+    for i, (p, s) in enumerate(zip(center, segments)):
+        cells, xs, ys = get_cells(np.minimum(p, p + s), np.maximum(p, p + s))
+        dx, dy = xs - p[0], ys - p[1]
+        t = np.clip((dx * s[0] + dy * s[1]) / lengths[i] ** 2, 0, 1) if lengths[i] > 0 else np.zeros_like(dx + dy)
+        dist = np.hypot(dx - t * s[0], dy - t * s[1])
+        closer = dist < segment_dist[cells]
+        segment_dist[cells] = np.where(closer, dist, segment_dist[cells])
+        segment[cells] = np.where(closer, i, segment[cells])
+        arc_length[cells] = np.where(closer, arc_lengths[i] + t * lengths[i], arc_length[cells])
+        offset[cells] = np.where(closer, np.copysign(dist, s[0] * dy - s[1] * dx), offset[cells])
+
+    return {
+        "grid": np.array([origin[0], origin[1], resolution, cols, rows, arc_lengths[-1]]),
+        "waypoint": waypoint,
+        "waypoint_dist": waypoint_dist.astype(np.float32),
+        "segment": segment,
+        "arc_length": arc_length.astype(np.float32),
+        "offset": offset.astype(np.float32),
+    }
+
+def build_raster(route, resolution=RESOLUTION, force=False):
+    '''Rasterize a route into the cache unless it is already there, and get its path'''
+    path = get_cache_path(route, resolution)
+    if os.path.isdir(path) and not force:
+        return path
+    return save_arrays(path, rasterize(load_track_geometry(route), resolution), force)
+
+class TrackRaster:
+    '''Answers the track queries of many positions by sampling memory-mapped rasters
+
+    The distances, arc length and offset are interpolated between the 4 closest
+    cell centers, the indexes come from the closest one. Positions off the raster
+    get the values of its border, more than the margin away from the track.
+    '''
+    def __init__(self, route, resolution=RESOLUTION):
+        path = build_raster(route, resolution)
+        # flat views of the mappings, np.take on them is faster than indexing a memmap
+        self.fields = {name: np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode="r")).ravel() for name in FIELDS}
+        x, y, self.resolution, cols, rows, self.total_length = np.load(os.path.join(path, "grid.npy")).tolist()
+        self.origin = np.array([x, y])
+        self.cols, self.rows = int(cols), int(rows)
+
+    def get_cells(self, points):
+        '''Get the cell below and left of each point, and the position of the point between the cell centers'''
+        u = (points - self.origin) / self.resolution - 0.5
+        low = np.clip(np.floor(u).astype(np.int64), 0, [self.cols - 2, self.rows - 2])
+        frac = np.clip(u - low, 0, 1)
+        return low[:, 1] * self.cols + low[:, 0], frac[:, 0], frac[:, 1]
+
+    def query(self, points):
+        '''Get the closest waypoint and distance to it, and the segment, arc length and signed offset of each point
+
+        Same as TrackQuery.closest and TrackProjection.project, within a cell.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cells, fx, fy = self.get_cells(points)
+        corners = np.stack([cells, cells + 1, cells + self.cols, cells + self.cols + 1])
+        weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+
+        def bilinear(field):
+            return (np.take(field, corners) * weights).sum(axis=0)
+
+        nearest = cells + np.where(fx < 0.5, 0, 1) + np.where(fy < 0.5, 0, self.cols)
+
+        # around the start line, the arc lengths of the corners are taken from the first one
+        arc_lengths = np.take(self.fields["arc_length"], corners).astype(float)
+        half = self.total_length / 2
+        arc_diff = ((arc_lengths - arc_lengths[0] + half) % self.total_length - half) * weights
+
+        return (
+            np.take(self.fields["waypoint"], nearest),
+            bilinear(self.fields["waypoint_dist"]),
+            np.take(self.fields["segment"], nearest),
+            (arc_lengths[0] + arc_diff.sum(axis=0)) % self.total_length,
+            bilinear(self.fields["offset"]),
+        )
+
+def parse_args():
+    params = get_route_params(TITLE)
+    params.add_argument("--resolution", type=float, default=RESOLUTION, help="meters per cell")
+    return params.parse_args()
+
+def run():
+    '''Build the raster of every route in parallel'''
+    args = parse_args()
+
+    routes = args.routes or get_route_names()
+
+    build = functools.partial(build_raster, resolution=args.resolution, force=args.force)
+    for route, path in build_routes(build, routes, args.workers):
+        print(route, path)
+
+    print("built", len(routes), "routes in", CACHE_DIR)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,189 @@
+import numpy as np
+
+from engine import DEFAULT_SPEED, FRAME_RATE, LAP_WRAP, freeze, get_waypoints
+from reward_pool import calculate_reward
+from track_index import TrackIndex
+from track_query import TrackProjection, closest_batch
+
+# Constants
+ENVS_COUNT = 64
+
+class VectorEnv:
+    '''Steps many independent cars on one track at once, every car state held in arrays
+
+    Each car drives like CarModel: it moves along its heading at the speed of its
+    action, then turns by the steering angle. An episode ends when the car goes off
+    track, with no wheel on it, completes a lap from its start waypoint or reaches
+    max_steps, and the car then keeps still until reset. There are no bots, the
+    cars do not see each other.
+    With a TrackRaster of the track the closest waypoint and the projection on the
+    center line are looked up in it instead.
+    '''
+    def __init__(self, track, reward_module, count=ENVS_COUNT, speed=DEFAULT_SPEED, max_steps=None, raster=None):
+        self.reward_module = reward_module
+        self.count = count
+        self.speed = speed
+        self.max_steps = max_steps
+        self.raster = raster
+
+        self.waypoints = np.asarray(get_waypoints(track, "center"), dtype=float)
+        geometry = track.get_geometry()
+        self.track_width = float(geometry["widths"][0])
+        self.track_index = TrackIndex(geometry)
+        self.projection = TrackProjection(geometry)
+
+        # shared by the params of every car
+        self.frozen_waypoints = freeze(self.waypoints.tolist())
+
+        self.pos = np.zeros((count, 2))
+        self.heading = np.zeros(count)  # degrees
+        self.speeds = np.full(count, float(speed))
+        self.steering_angles = np.zeros(count)
+        self.start_idx = np.zeros(count, dtype=int)
+        self.closest_idx = np.zeros(count, dtype=int)
+        self.closest_dist = np.zeros(count)
+        self.segment_idx = np.zeros(count, dtype=int)
+        self.arc_length = np.zeros(count)
+        self.offset = np.zeros(count)
+        self.progress = np.zeros(count)
+        self.steps = np.zeros(count, dtype=int)
+        self.all_wheels_on_track = np.ones(count, dtype=bool)
+        self.offtrack = np.zeros(count, dtype=bool)
+        self.lap_completed = np.zeros(count, dtype=bool)
+        self.done = np.zeros(count, dtype=bool)
+
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self, mask=None, start_indexes=0):
+        '''Start new episodes for the cars in mask, all by default, at the given waypoints
+
+        Returns the params of every car.
+        '''
+        mask = np.ones(self.count, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        length = len(self.waypoints)
+        start_idx = np.broadcast_to(np.asarray(start_indexes, dtype=int) % length, (self.count,))[mask]
+
+        start = self.waypoints[start_idx]
+        target = self.waypoints[(start_idx + 1) % length]
+
+        self.pos[mask] = start
+        self.heading[mask] = np.degrees(np.arctan2(target[:, 1] - start[:, 1], target[:, 0] - start[:, 0]))
+        self.speeds[mask] = self.speed
+        self.steering_angles[mask] = 0
+        self.start_idx[mask] = start_idx
+        self.closest_idx[mask] = start_idx
+        self.closest_dist[mask] = 0
+        self.segment_idx[mask] = start_idx
+        self.arc_length[mask] = self.projection.arc_lengths[start_idx]
+        self.offset[mask] = 0
+        self.progress[mask] = 0
+        self.steps[mask] = 0
+        self.all_wheels_on_track[mask] = self.track_index.wheels_on_track(self.pos[mask], self.heading[mask])
+        self.offtrack[mask] = False
+        self.lap_completed[mask] = False
+        self.done[mask] = False
+
+        return self.get_params()
+
+    def step(self, actions):
+        '''Drive every car that is not done with its (steering_angle, speed) action
+
+        Returns the params and the rewards of every car, and which ones are done.
+        The cars that were already done get a reward of 0.
+        '''
+        actions = np.asarray(actions, dtype=float).reshape(self.count, 2)
+        active = ~self.done
+
+        # moving
+        steering_angles = actions[active, 0]
+        speeds = actions[active, 1]
+        rad = np.radians(self.heading[active])
+        self.pos[active] += np.stack([np.cos(rad), np.sin(rad)], axis=1) * (speeds / FRAME_RATE)[:, None]
+
+        heading = self.heading[active] + steering_angles
+        heading = np.where(heading > 180, heading - 360, heading)
+        heading = np.where(heading < -180, heading + 360, heading)
+        self.heading[active] = heading
+        self.speeds[active] = speeds
+        self.steering_angles[active] = steering_angles
+        self.steps[active] += 1
+
+        # closest
+        if self.raster is not None:
+            self.closest_idx, self.closest_dist, self.segment_idx, self.arc_length, self.offset = self.raster.query(self.pos)
+        else:
+            self.closest_dist, self.closest_idx = closest_batch(self.waypoints, self.pos, self.closest_idx)
+            self.segment_idx, self.arc_length, self.offset = self.projection.project(self.pos, self.segment_idx)
+
+        # progress along the center line, from the start waypoint of the episode
+        start_arc_length = self.projection.arc_lengths[self.start_idx]
+        progress = self.projection.get_progress((self.arc_length - start_arc_length) % self.projection.total_length)
+        lap_completed = active & (self.progress - progress > LAP_WRAP)
+        progress[lap_completed] = 100
+        self.progress = np.where(active, progress, self.progress)
+        self.lap_completed |= lap_completed
+
+        # Off track, once no wheel is on the track
+        wheels_inside = self.track_index.wheels_inside(self.pos, self.heading)
+        self.all_wheels_on_track = wheels_inside.all(axis=1)
+        self.offtrack |= active & ~wheels_inside.any(axis=1)
+
+        done = self.offtrack | self.lap_completed
+        if self.max_steps is not None:
+            done |= self.steps >= self.max_steps
+        self.done = done
+
+        all_params = self.get_params()
+
+        rewards = np.zeros(self.count)
+        for i in np.flatnonzero(active).tolist():
+            params = all_params[i]
+            rewards[i] = calculate_reward(self.reward_module, params, params["speed"], params["steering_angle"])["reward"]
+
+        return all_params, rewards, self.done.copy()
+
+    def get_params(self):
+        '''Get the DeepRacer params of every car'''
+        length = len(self.waypoints)
+        columns = zip(
+            self.pos[:, 0].tolist(),
+            self.pos[:, 1].tolist(),
+            self.heading.tolist(),
+            self.speeds.tolist(),
+            self.steering_angles.tolist(),
+            self.segment_idx.tolist(),
+            self.offset.tolist(),
+            self.progress.tolist(),
+            self.steps.tolist(),
+            self.offtrack.tolist(),
+            self.all_wheels_on_track.tolist(),
+        )
+
+        all_params = []
+        for x, y, heading, speed, steering_angle, segment_idx, offset, progress, steps, offtrack, all_wheels_on_track in columns:
+            all_params.append({
+                "all_wheels_on_track": all_wheels_on_track,
+                "closest_objects": (),
+                "closest_waypoints": (segment_idx, (segment_idx + 1) % length),
+                "is_crashed": False,
+                "distance_from_center": abs(offset),
+                "heading": heading,
+                "is_left_of_center": offset > 0,
+                "is_reversed": False,
+                "objects_distance": (),
+                "objects_left_of_center": (),
+                "objects_location": (),
+                "is_offtrack": offtrack,
+                "progress": progress,
+                "speed": speed,
+                "steering_angle": steering_angle,
+                "steps": steps,
+                "track_width": self.track_width,
+                "waypoints": self.frozen_waypoints,
+                "x": x,
+                "y": y,
+            })
+        return all_params